@@ -1,9 +1,12 @@
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 import itertools
 import math
-from typing import Any, Generator, Iterable, Optional, cast
-from PIL import Image, ImageChops
+from typing import Any, Callable, Generator, Iterable, Iterator, Optional, cast
+from PIL import Image
 
+from compositing import add_shadow, blend, premultiplied, without_alpha
 from mod_reader import ModReader
 
 
@@ -41,15 +44,20 @@ class Layer():
                 return stripe
         raise ValueError()
 
-    def get_image(self, reader: ModReader, frame_no: int) -> Image.Image:
+    def sheet_key(self) -> tuple[Any, ...]:
+        # Everything that decides which pixels get_image returns for a frame.
+        return (self.filename, repr(self.stripes), self.x, self.y, self.width, self.height, self.line_length,
+                self.scale, self.blend_mode)
+
+    def get_image(self, reader: ModReader, frame_no: int, frames: Optional['FrameCache'] = None) -> Image.Image:
         frame_no = self.frame_sequence[frame_no] - 1
         if self.filename:
-            raw = reader.get_image(self.filename, self.blend_mode != 'additive')
+            filename = self.filename
             row = frame_no // self.line_length
             col = frame_no % self.line_length
         else:
             stripe = self.get_stripe(frame_no)
-            raw = reader.get_image(stripe['filename'], self.blend_mode != 'additive')
+            filename = stripe['filename']
             row = frame_no // stripe['width_in_frames']
             col = frame_no % stripe['width_in_frames']
 
@@ -60,10 +68,50 @@ class Layer():
             self.y + (row+1) * self.height)
         size = (int(self.width * self.scale), int(self.height * self.scale))
 
-        return raw.crop(position).resize(size)
+        def load() -> Image.Image:
+            image = reader.get_frame(filename, position)
+            if self.blend_mode == 'additive':
+                image = without_alpha(image)
+            image = image.resize(size)
+            if self.blend_mode == 'additive-soft':
+                image = premultiplied(image)
+            return image
 
+        if frames is None or self.sheet_key() not in frames.shared:
+            return load()
+        return frames.get((filename, position, size, self.blend_mode), load)
 
-def get_animation(reader: ModReader, spec: Iterable[Layer]) -> Generator[Image.Image, None, None]:
+
+class FrameCache:
+    """Resized layer frames, shared by the animations of one entity.
+
+    Directions often fall back to the same layers, and variants such as the
+    rocket silo's open and closed states share most of theirs. Only frames of
+    layers that appear in more than one of the animations are kept.
+    """
+
+    def __init__(self, specs: Iterable[list[Layer]]):
+        uses = Counter(key for spec in specs for key in {layer.sheet_key() for layer in spec})
+        self.shared = {key for key, count in uses.items() if count > 1}
+        self.frames: dict[tuple[Any, ...], Image.Image] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[Any, ...], load: Callable[[], Image.Image]) -> Image.Image:
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.hits += 1
+            return frame
+        self.misses += 1
+        frame = self.frames[key] = load()
+        return frame
+
+
+# Frames were written without a duration, which browsers show for 100ms.
+FRAME_DURATION_MS = 100
+
+
+def _layout(spec: Iterable[Layer]) -> tuple[list[Layer], tuple[int, int], tuple[int, int], int]:
     spec = list(spec)
     layers = [l for l in spec if l.draw_as_shadow] + [l for l in spec if not l.draw_as_shadow]
     frame_count = math.lcm(*(len(l.frame_sequence) for l in layers))
@@ -77,33 +125,101 @@ def get_animation(reader: ModReader, spec: Iterable[Layer]) -> Generator[Image.I
     height = int(y_end - y_start)
     x_origin = width - x_end
     y_origin = height - y_end
-    for frame_no in range(frame_count):
-        frame = Image.new(mode='RGBA', size=(width, height))
+    return layers, (width, height), (x_origin, y_origin), frame_count
+
+
+def _render_frame(reader: ModReader, layers: list[Layer], size: tuple[int, int], origin: tuple[int, int],
+                  frame_no: int, frames: Optional[FrameCache] = None) -> Image.Image:
+    frame = Image.new(mode='RGBA', size=size)
 
-        for layer in layers:
-            layer_frame_no = frame_no % len(layer.frame_sequence)
+    for layer in layers:
+        layer_frame_no = frame_no % len(layer.frame_sequence)
 
-            image = layer.get_image(reader, layer_frame_no)
-            shift_x, shift_y, _1, _2 = layer.get_bounds()
-            offset_x = int(shift_x + x_origin)
-            offset_y = int(shift_y + y_origin)
+        image = layer.get_image(reader, layer_frame_no, frames)
+        shift_x, shift_y, _1, _2 = layer.get_bounds()
+        offset_x = int(shift_x + origin[0])
+        offset_y = int(shift_y + origin[1])
 
-            background = frame.crop((offset_x, offset_y, offset_x + image.width, offset_y + image.height))
+        if layer.draw_as_shadow:
+            add_shadow(frame, image, (offset_x, offset_y))
+            continue
 
-            if layer.blend_mode == 'additive':
-                # TODO
-                # (1) Add the other blend modes. https://lua-api.factorio.com/1.1.110/types/BlendMode.html
-                # (2) Consolidate this code with the icon.py code.
-                result = ImageChops.add(background, image)
-            else:  # normal
-                result = Image.alpha_composite(background, image)
+        background = frame.crop((offset_x, offset_y, offset_x + image.width, offset_y + image.height))
+        frame.paste(blend(background, image, layer.blend_mode), (offset_x, offset_y))
 
-            frame.paste(result, (offset_x, offset_y))
+    return frame
 
-        yield frame
+
+def get_animation(reader: ModReader, spec: Iterable[Layer]) -> Generator[Image.Image, None, None]:
+    layers, size, origin, frame_count = _layout(spec)
+    for frame_no in range(frame_count):
+        yield _render_frame(reader, layers, size, origin, frame_no)
     return
 
 
+def _frame_runs(layers: list[Layer], frame_count: int) -> list[tuple[tuple[int, ...], int, int]]:
+    # A frame is determined by the sprite each layer shows in it, so frames
+    # with the same sprites are the same image. Returns (sprites, first frame
+    # number, repeats) for each run of equal frames in the shortest cycle.
+    keys = [tuple(layer.frame_sequence[frame_no % len(layer.frame_sequence)] for layer in layers)
+            for frame_no in range(frame_count)]
+    period = next(p for p in range(1, frame_count + 1)
+                  if frame_count % p == 0 and all(keys[i] == keys[i - p] for i in range(p, frame_count)))
+
+    runs: list[tuple[tuple[int, ...], int, int]] = []
+    for frame_no, key in enumerate(keys[:period]):
+        if runs and runs[-1][0] == key:
+            runs[-1] = (key, runs[-1][1], runs[-1][2] + 1)
+        else:
+            runs.append((key, frame_no, 1))
+    return runs
+
+
+def _render_in_order(render: Callable[[int], Image.Image], frame_nos: list[int],
+                     workers: int) -> Iterator[Image.Image]:
+    if workers <= 1:
+        yield from map(render, frame_nos)
+        return
+    # Only run a few frames ahead of the consumer, so at most that many
+    # rendered frames wait in memory.
+    with ThreadPoolExecutor(workers) as executor:
+        pending: deque[Future[Image.Image]] = deque()
+        for frame_no in frame_nos:
+            pending.append(executor.submit(render, frame_no))
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def get_animation_frames(reader: ModReader, spec: Iterable[Layer], workers: int = 1,
+                         frames: Optional[FrameCache] = None) -> tuple[list[int], Iterator[Image.Image]]:
+    """Return how long each distinct frame is shown, in ms, and the frames.
+
+    The animation is cut to its shortest repeating cycle and a run of equal
+    frames becomes one longer frame. A frame that comes back later in the
+    cycle is rendered once and kept until then. Frames are rendered in
+    order as they are consumed, up to `workers` at a time.
+    """
+    layers, size, origin, frame_count = _layout(spec)
+    runs = _frame_runs(layers, frame_count)
+    last_use = {key: i for i, (key, _, _) in enumerate(runs)}
+    first_use = {key: frame_no for key, frame_no, _ in reversed(runs)}
+    to_render = [frame_no for key, frame_no, _ in runs if first_use[key] == frame_no]
+
+    def ordered() -> Iterator[Image.Image]:
+        rendered = _render_in_order(lambda n: _render_frame(reader, layers, size, origin, n, frames), to_render,
+                                    workers)
+        kept: dict[tuple[int, ...], Image.Image] = {}
+        for i, (key, _, _) in enumerate(runs):
+            frame = kept.pop(key) if key in kept else next(rendered)
+            if last_use[key] > i:
+                kept[key] = frame
+            yield frame
+
+    return [repeats * FRAME_DURATION_MS for _, _, repeats in runs], ordered()
+
+
 def get_layers(spec: Any) -> list[Layer]:
     if not spec:
         return []
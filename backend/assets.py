@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional
+
+from render import RenderFailure, RenderJob
+
+
+class AssetStore:
+    def __init__(self, root: Path, force: bool = False):
+        self.root = root
+        self.force = force
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Asset -> the regime files that should point at it once it exists.
+        self.targets: dict[Path, list[Path]] = {}
+
+    def plan(self, job: RenderJob, digest: str) -> Optional[RenderJob]:
+        asset = self.root / f'{digest}{job.filename.suffix}'
+        if asset in self.targets:
+            self.targets[asset].append(job.filename)
+            return None
+
+        self.targets[asset] = [job.filename]
+        if asset.exists() and not self.force:
+            return None
+        return job._replace(filename=asset)
+
+    def link(self, failed: Iterable[RenderFailure]) -> dict[Path, str]:
+        # Returns the regime files that are left without an asset, and why.
+        errors = {failure.job.filename: failure.error for failure in failed}
+        failed_targets: dict[Path, str] = {}
+        for asset, targets in self.targets.items():
+            if asset in errors or not asset.exists():
+                error = errors.get(asset, f'{asset} was not written')
+                failed_targets.update((target, error) for target in targets)
+                continue
+            for target in targets:
+                _link_or_copy(asset, target)
+        self.targets = {}
+        return failed_targets
+
+    def collect_garbage(self, output: Path) -> None:
+        referenced: set[str] = set()
+        for manifest_file in output.glob('*/render-manifest.json'):
+            with open(manifest_file) as f:
+                manifest: dict[str, str] = json.load(f)
+            for filename, digest in manifest.items():
+                referenced.add(f'{digest}{Path(filename).suffix}')
+
+        for asset in self.root.iterdir():
+            if asset.name not in referenced:
+                asset.unlink()
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    temp = target.with_name(f'.{target.name}.{os.getpid()}.tmp')
+    try:
+        os.link(source, temp)
+    except OSError:
+        # Filesystems without hard links, or an asset store on another device.
+        shutil.copyfile(source, temp)
+    os.replace(temp, target)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import NamedTuple, TypedDict
+from PIL import Image
+
+from data_writer import write_json
+
+
+# Sheets are at most this wide and tall. Every browser handles far larger
+# images, but a page can start drawing after the first few smaller sheets.
+ATLAS_SIZE = 2048
+# Transparent pixels around each icon, so that a scaled-down sheet never
+# bleeds a neighbour into its edges.
+PADDING = 1
+# Bump when the layout changes, so that existing sheets are redrawn.
+ATLAS_VERSION = 2
+
+
+class AtlasIcon(NamedTuple):
+    prototype_type: str
+    name: str
+    size: int
+    asset: Path
+    digest: str
+
+
+class Sheet(TypedDict):
+    file: str
+    width: int
+    height: int
+
+
+class SizeIndex(TypedDict):
+    sheets: list[Sheet]
+    # '<type>/<name>' to [sheet, x, y, width, height]
+    icons: dict[str, list[int]]
+
+
+def pack(sizes: list[tuple[int, int]], max_size: int = ATLAS_SIZE) -> list[tuple[int, int, int]]:
+    """Place rectangles on sheets of at most max_size square; returns (sheet, x, y) for each.
+
+    Shelves, tallest rectangles first: fills a row left to right, starts a
+    new row under it when the next one does not fit, and a new sheet when
+    the row does not. Icons of one size are nearly all the same square, for
+    which this wastes almost nothing.
+    """
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0], i))
+    placed: list[tuple[int, int, int]] = [(0, 0, 0)] * len(sizes)
+    sheet = x = y = shelf_height = 0
+    for i in order:
+        width, height = sizes[i][0] + 2 * PADDING, sizes[i][1] + 2 * PADDING
+        if width > max_size or height > max_size:
+            raise ValueError(f'A {sizes[i][0]}x{sizes[i][1]} icon does not fit on a {max_size}px sheet')
+        if x + width > max_size:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + height > max_size:
+            sheet, x, y, shelf_height = sheet + 1, 0, 0, 0
+        placed[i] = (sheet, x + PADDING, y + PADDING)
+        x += width
+        shelf_height = max(shelf_height, height)
+    return placed
+
+
+def _group_digest(icons: list[AtlasIcon]) -> str:
+    digest = hashlib.sha256(f'{ATLAS_VERSION} {ATLAS_SIZE} {PADDING}\n'.encode('utf-8'))
+    for icon in icons:
+        digest.update(f'{icon.prototype_type}/{icon.name}={icon.digest}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _draw_group(atlas_dir: Path, prefix: str, icons: list[AtlasIcon],
+                unchanged: bool) -> tuple[list[Sheet], list[tuple[int, int, int, int, int]]]:
+    # Opening a PNG only reads its header, so laying out is cheap; the
+    # sheets are only drawn again when an icon in them changed.
+    sizes: list[tuple[int, int]] = []
+    for icon in icons:
+        with Image.open(icon.asset) as image:
+            sizes.append(image.size)
+    placed = pack(sizes)
+    sheet_count = max(sheet for sheet, _, _ in placed) + 1
+
+    extents: list[list[int]] = [[0, 0] for _ in range(sheet_count)]
+    for (sheet, x, y), (width, height) in zip(placed, sizes):
+        extents[sheet][0] = max(extents[sheet][0], x + width + PADDING)
+        extents[sheet][1] = max(extents[sheet][1], y + height + PADDING)
+    sheets = [Sheet(file=f'{prefix}-{n}.png', width=width, height=height) for n, (width, height) in enumerate(extents)]
+
+    if not unchanged or not all((atlas_dir / s['file']).exists() for s in sheets):
+        images = [Image.new('RGBA', (s['width'], s['height'])) for s in sheets]
+        for icon, (sheet, x, y) in zip(icons, placed):
+            with Image.open(icon.asset) as image:
+                images[sheet].paste(image.convert('RGBA'), (x, y))
+        for image, s in zip(images, sheets):
+            image.save(atlas_dir / s['file'])
+    return sheets, [(sheet, x, y, width, height) for (sheet, x, y), (width, height) in zip(placed, sizes)]
+
+
+def write_atlases(regime_dir: Path, icons: list[AtlasIcon], group_by: str) -> None:
+    """Pack a regime's icons into <regime>/atlas/<size>/ and index them in atlas/index.json.
+
+    One set of sheets per icon size and per prototype type (group_by='type')
+    or for the whole regime (group_by='regime'). Under 'sizes', the index
+    lists each size's sheets and maps '<type>/<name>' to [sheet, x, y,
+    width, height] on them.
+    """
+    atlas_dir = regime_dir / 'atlas'
+    atlas_dir.mkdir(parents=True, exist_ok=True)
+    index_file = atlas_dir / 'index.json'
+    previous: dict[str, str] = {}
+    if index_file.exists():
+        with open(index_file) as f:
+            previous = json.load(f).get('digests', {})
+
+    groups: dict[tuple[int, str], dict[str, AtlasIcon]] = {}
+    for icon in icons:
+        group = icon.prototype_type if group_by == 'type' else 'icons'
+        groups.setdefault((icon.size, group), {})[f'{icon.prototype_type}/{icon.name}'] = icon
+
+    sizes: dict[str, SizeIndex] = {}
+    digests: dict[str, str] = {}
+    for (size, group), members in sorted(groups.items()):
+        keys = sorted(members)
+        prefix = f'{size}/{group}'
+        (atlas_dir / str(size)).mkdir(exist_ok=True)
+        digests[prefix] = _group_digest([members[key] for key in keys])
+        sheets, positions = _draw_group(atlas_dir, prefix, [members[key] for key in keys],
+                                        previous.get(prefix) == digests[prefix])
+
+        entry = sizes.setdefault(str(size), SizeIndex(sheets=[], icons={}))
+        first_sheet = len(entry['sheets'])
+        entry['sheets'].extend(sheets)
+        for key, (sheet, x, y, width, height) in zip(keys, positions):
+            entry['icons'][key] = [first_sheet + sheet, x, y, width, height]
+
+    used = {s['file'] for entry in sizes.values() for s in entry['sheets']}
+    for stale in atlas_dir.rglob('*.png'):
+        if stale.relative_to(atlas_dir).as_posix() not in used:
+            stale.unlink()
+    write_json(index_file, {'sizes': sizes, 'digests': digests}, compact=True)
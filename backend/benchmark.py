@@ -0,0 +1,394 @@
+import click
+import concurrent.futures
+import gc
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, TypeVar, cast
+from PIL import Image
+
+from compositing import RGBA, apply_tint
+
+
+T = TypeVar('T')
+
+BENCHMARK_DIR = Path(__file__).parent / 'benchmarks'
+# A base game and mod cache that stand in for FACTORIO_BASE and --mod-cache-dir,
+# so that the suite runs offline and always measures the same work. The
+# locale files are generated into a copy of them; see _build_fixture.
+FIXTURE_BASE = BENCHMARK_DIR / 'fixture'
+FIXTURE_MODS = BENCHMARK_DIR / 'mods'
+FIXTURE_MOD_LIST = ['bench-overhaul']
+# (file under the fixture, section, key prefix, value prefix, count), in the
+# order they are written; the counts match the prototypes the Lua creates.
+FIXTURE_LOCALE = [
+    ('fixture/base/locale/en/base.cfg', 'item-name', 'item', 'Item', 1200),
+    ('fixture/base/locale/en/base.cfg', 'technology-name', 'technology', 'Technology', 300),
+    ('fixture/base/locale/en/base.cfg', 'entity-name', 'assembler', 'Assembling machine', 12),
+    ('fixture/base/locale/de/base.cfg', 'item-name', 'item', 'Gegenstand', 1200),
+    ('fixture/base/locale/de/base.cfg', 'technology-name', 'technology', 'Technologie', 300),
+    ('mods/bench-library/locale/en/locale.cfg', 'item-name', 'library-item', 'Library item', 100),
+]
+# A stage only counts as slower when its fastest run is behind by more than
+# this many times the spread of either run.
+NOISE_FACTOR = 3
+
+
+def _samples(repeat: int, setup: Callable[[], T], fn: Callable[[T], object]) -> list[float]:
+    # The setup is for stages whose input is used up, or that have to start
+    # cold. Like timeit, the garbage collector is kept from running in the
+    # middle.
+    samples: list[float] = []
+    for _ in range(repeat):
+        argument = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn(argument)
+            samples.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return samples
+
+
+def _best_of(repeat: int, fn: Callable[[], object]) -> float:
+    return min(_samples(repeat, lambda: None, lambda _: fn()))
+
+
+def _timing(samples: list[float]) -> dict[str, float]:
+    # The fastest run is the least disturbed one; how far the median is
+    # behind it says how noisy the machine was.
+    return {'best': min(samples), 'median': statistics.median(samples)}
+
+
+def _legacy_tint(image: Image.Image, tint: RGBA) -> Image.Image:
+    # The per-pixel loop that icon.py used before compositing.apply_tint.
+    # Pillow's stubs allow for any mode; these are RGBA pixels.
+    pixels = cast(Iterable[tuple[int, int, int, int]], image.getdata())
+    data = bytearray()
+    for r, g, b, a in pixels:
+        data += bytes((int(r * tint.r), int(g * tint.g), int(b * tint.b), int(a * tint.a)))
+    return Image.frombytes('RGBA', image.size, bytes(data))
+
+
+def _build_fixture(directory: Path) -> tuple[Path, Path]:
+    """Copy the fixture game and mods into directory and write their locale; returns the two copies."""
+    base = shutil.copytree(FIXTURE_BASE, directory / 'fixture')
+    mods = shutil.copytree(FIXTURE_MODS, directory / 'mods')
+    sections: dict[Path, list[str]] = {}
+    for filename, section, key, value, count in FIXTURE_LOCALE:
+        lines = [f'[{section}]'] + [f'{key}-{i}={value} {i}' for i in range(1, count + 1)]
+        sections.setdefault(directory / filename, []).append('\n'.join(lines) + '\n')
+    for path, texts in sections.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('\n'.join(texts), encoding='utf-8')
+    return base, mods
+
+
+@click.group()
+def cli() -> None:
+    pass
+
+
+@cli.command()
+@click.option('--factorio-base', envvar='FACTORIO_BASE', required=True,
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--limit', default=200, help='Number of base-game icons to use')
+@click.option('--repeat', default=5)
+def compositing(factorio_base: Path, limit: int, repeat: int) -> None:
+    """Compare the lookup-table tint with the old per-pixel loop on base-game icons."""
+    icon_files = sorted((factorio_base / 'base' / 'graphics' / 'icons').glob('*.png'))[:limit]
+    images = [Image.open(f).convert('RGBA') for f in icon_files]
+    tint = RGBA(0.8, 0.6, 0.4, 0.9)
+
+    for image in images:
+        if _legacy_tint(image, tint).tobytes() != apply_tint(image, tint).tobytes():
+            raise click.ClickException('apply_tint does not match the per-pixel implementation')
+
+    legacy = _best_of(repeat, lambda: [_legacy_tint(image, tint) for image in images])
+    vectorized = _best_of(repeat, lambda: [apply_tint(image, tint) for image in images])
+    pixels = sum(image.width * image.height for image in images)
+    print(f'{len(images)} icons, {pixels / 1e6:.1f} Mpixels')
+    print(f'{"tint":<20} {"seconds":>10} {"Mpixels/s":>10}')
+    for name, seconds in [('per-pixel loop', legacy), ('lookup table', vectorized)]:
+        print(f'{name:<20} {seconds:>10.4f} {pixels / seconds / 1e6:>10.1f}')
+    print(f'speedup: {legacy / vectorized:.1f}x')
+
+
+def _render_specs(factorio_base: Path, mod_cache_dir: Path, data_cache_dir: Path, type_name: str,
+                  name: str) -> tuple[int, float, int]:
+    from animation import get_animation, get_animation_specs
+    from factorio_data import get_factorio_data
+
+    data, reader = get_factorio_data(factorio_base, mod_cache_dir, [], '', '', True, data_cache_dir)
+    specs = get_animation_specs(data['raw'][type_name][name])
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    frames = 0
+    for spec in specs.values():
+        frames += sum(1 for _ in get_animation(reader, spec))
+    elapsed = time.perf_counter() - start
+    return frames, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+
+def _time_lua_conversion(factorio_base: Path, mod_cache_dir: Path, username: str, token: str, mods: list[str],
+                         repeat: int) -> tuple[float, float]:
+    from factorio_data import init_lua, populate_mod_list, read_raw_data
+    from mod_reader import ModReader
+    from utils import lua_table_converter, lua_table_to_python
+
+    reader = ModReader(factorio_base, mod_cache_dir, username, token)
+    mod_list, mod_info = populate_mod_list(reader, set(mods))
+    lua, chunks = init_lua(reader, factorio_base, True)
+    read_raw_data(lua, chunks, reader, mod_list, {name: info.get('version') for name, info in mod_info.items()})
+    raw = lua.globals()['data']['raw']
+
+    convert = lua_table_converter(lua)
+    # repr, so that NaNs and key order count as well.
+    if repr(convert(raw)) != repr(lua_table_to_python(raw)):
+        raise click.ClickException('lua_table_converter does not match lua_table_to_python')
+    return _best_of(repeat, lambda: lua_table_to_python(raw)), _best_of(repeat, lambda: convert(raw))
+
+
+@cli.command('lua-conversion')
+@click.option('--factorio-base', envvar='FACTORIO_BASE', required=True,
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--mod-cache-dir', default='mod_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--factorio-username', envvar='FACTORIO_USERNAME', default='')
+@click.option('--factorio-token', envvar='FACTORIO_TOKEN', default='')
+@click.option('--repeat', default=3)
+@click.argument('mods', nargs=-1)
+def lua_conversion(factorio_base: Path, mod_cache_dir: Path, factorio_username: str, factorio_token: str,
+                   repeat: int, mods: tuple[str, ...]) -> None:
+    """Time converting data.raw to Python for the base game, and for the base game plus MODS (e.g. k2spacex)."""
+    regimes: list[tuple[str, list[str]]] = [('base', [])]
+    if mods:
+        regimes.append((' + '.join(mods), list(mods)))
+    print(f'{"mods":<40} {"per-node":>10} {"bulk":>10} {"speedup":>8}')
+    for name, mod_list in regimes:
+        legacy, bulk = _time_lua_conversion(factorio_base, mod_cache_dir, factorio_username, factorio_token,
+                                            mod_list, repeat)
+        print(f'{name:<40} {legacy:>10.3f} {bulk:>10.3f} {legacy / bulk:>7.1f}x')
+
+
+@cli.command()
+@click.option('--factorio-base', envvar='FACTORIO_BASE', required=True,
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--mod-cache-dir', default='mod_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--data-cache-dir', default='data_cache',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.argument('prototypes', nargs=-1)
+def sprites(factorio_base: Path, mod_cache_dir: Path, data_cache_dir: Path, prototypes: tuple[str, ...]) -> None:
+    """Time and peak memory of rendering every animation of base-game prototypes, given as TYPE/NAME."""
+    if not prototypes:
+        prototypes = ('rocket-silo/rocket-silo', 'transport-belt/transport-belt')
+
+    print(f'{"prototype":<40} {"frames":>8} {"seconds":>10} {"peak RSS MB":>12}')
+    for prototype in prototypes:
+        type_name, name = prototype.split('/')
+        # A fresh process per prototype, so that the peak RSS is its own.
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result: Any = executor.submit(_render_specs, factorio_base, mod_cache_dir, data_cache_dir,
+                                          type_name, name).result()
+        frames, elapsed, peak = result
+        # ru_maxrss is in KiB on Linux.
+        print(f'{prototype:<40} {frames:>8} {elapsed:>10.2f} {peak / 1024:>12.1f}')
+
+
+def _legacy_write_animation(filename: Path, frames: list[Image.Image]) -> None:
+    # What utils.write_animation did before frames were deduplicated.
+    frames[0].save(filename, save_all=True, append_images=frames[1:], optimize=True)
+
+
+@cli.command()
+@click.option('--factorio-base', envvar='FACTORIO_BASE', required=True,
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--mod-cache-dir', default='mod_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--data-cache-dir', default='data_cache',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--workers', default=4, help='Frames to render at once')
+@click.argument('prototypes', nargs=-1)
+def animations(factorio_base: Path, mod_cache_dir: Path, data_cache_dir: Path, workers: int,
+               prototypes: tuple[str, ...]) -> None:
+    """Compare encoding every frame with the deduplicating encoder on base-game prototypes, given as TYPE/NAME."""
+    from animation import FRAME_DURATION_MS, get_animation, get_animation_frames, get_animation_specs
+    from factorio_data import get_factorio_data
+    from utils import write_animation
+
+    if not prototypes:
+        prototypes = ('assembling-machine/assembling-machine-2', 'lab/lab', 'rocket-silo/rocket-silo')
+    data, reader = get_factorio_data(factorio_base, mod_cache_dir, [], '', '', True, data_cache_dir)
+
+    print(f'{"animation":<48} {"frames":>7} {"kept":>5} {"before s":>9} {"after s":>8} {"before KB":>10} '
+          f'{"after KB":>9}')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for prototype in prototypes:
+            type_name, name = prototype.split('/')
+            for key, spec in get_animation_specs(data['raw'][type_name][name]).items():
+                durations, kept = get_animation_frames(reader, spec)
+                # Played back, the kept frames must be every frame of the old
+                # encoder, in the same order and for as long.
+                cycle = [frame.tobytes() for frame, duration in zip(kept, durations)
+                         for _ in range(duration // FRAME_DURATION_MS)]
+                frame_count = 0
+                for frame_no, frame in enumerate(get_animation(reader, spec)):
+                    if frame.tobytes() != cycle[frame_no % len(cycle)]:
+                        raise click.ClickException(f'{prototype}/{key}: frame {frame_no} differs')
+                    frame_count += 1
+
+                before = Path(temp_dir) / 'before.webp'
+                after = Path(temp_dir) / 'after.webp'
+                legacy = _best_of(1, lambda: _legacy_write_animation(before, list(get_animation(reader, spec))))
+                current = _best_of(1, lambda: write_animation(after, spec, reader, workers))
+                print(f'{prototype + "/" + key:<48} {frame_count:>7} {len(durations):>5} {legacy:>9.2f} '
+                      f'{current:>8.2f} {before.stat().st_size / 1024:>10.1f} {after.stat().st_size / 1024:>9.1f}')
+
+
+def _run_suite(repeat: int, temp_dir: Path) -> dict[str, dict[str, float]]:
+    from animation import get_animation, get_animation_specs
+    from chunk_cache import ChunkCache
+    from data_writer import write_data
+    from factorio_data import init_locale, init_lua, populate_mod_list, read_raw_data
+    from icon import get_factorio_icon, get_icon_specs
+    from mod_reader import ModReader, image_cache
+    from utils import lua_table_converter, lua_table_to_python, write_animation
+
+    fixture_base, fixture_mods = _build_fixture(temp_dir / 'fixture')
+    output = temp_dir / 'output'
+    output.mkdir()
+
+    def new_reader() -> ModReader:
+        return ModReader(fixture_base, fixture_mods, '', '')
+
+    def cold_cache() -> None:
+        image_cache.clear()
+
+    reader = new_reader()
+    mod_list, mod_info = populate_mod_list(reader, set(FIXTURE_MOD_LIST))
+    mod_versions = {name: info.get('version') for name, info in mod_info.items()}
+
+    def new_lua() -> tuple[Any, ChunkCache]:
+        return init_lua(reader, fixture_base, True)
+
+    lua, chunks = new_lua()
+    read_raw_data(lua, chunks, reader, mod_list, mod_versions)
+    raw_table = lua.globals()['data']['raw']
+    convert = lua_table_converter(lua)
+    raw = convert(raw_table)
+    data = {'raw': raw, 'locale': init_locale(reader, mod_list), 'mod_versions': mod_versions}
+
+    icon_specs = [get_icon_specs(prototype) for prototypes in raw.values() for prototype in prototypes.values()
+                  if 'icon' in prototype or 'icons' in prototype]
+    animation_specs = [spec for prototypes in raw.values() for prototype in prototypes.values()
+                       for spec in get_animation_specs(prototype).values()]
+
+    def write_animations(_: None) -> None:
+        for i, spec in enumerate(animation_specs):
+            write_animation(output / f'{i}.webp', spec, reader)
+
+    def run(fn: Callable[[], object]) -> dict[str, float]:
+        return _timing(_samples(repeat, lambda: None, lambda _: fn()))
+
+    def run_with(setup: Callable[[], T], fn: Callable[[T], object]) -> dict[str, float]:
+        return _timing(_samples(repeat, setup, fn))
+
+    stages: dict[str, dict[str, float]] = {}
+    stages['populate_mod_list'] = run_with(new_reader, lambda r: populate_mod_list(r, set(FIXTURE_MOD_LIST)))
+    stages['init_locale'] = run(lambda: init_locale(reader, mod_list))
+    stages['init_lua'] = run(new_lua)
+    stages['read_raw_data'] = run_with(
+        new_lua, lambda lua_chunks: read_raw_data(lua_chunks[0], lua_chunks[1], reader, mod_list, mod_versions))
+    stages['lua_table_to_python'] = run(lambda: lua_table_to_python(raw_table))
+    stages['lua_table_converter'] = run(lambda: convert(raw_table))
+    stages['write_data'] = run(lambda: write_data(output, data))
+    stages['get_factorio_icon'] = run_with(
+        cold_cache, lambda _: [get_factorio_icon(reader, spec) for spec in icon_specs])
+    stages['get_animation'] = run_with(
+        cold_cache, lambda _: [sum(1 for _ in get_animation(reader, spec)) for spec in animation_specs])
+    stages['write_animation'] = run_with(cold_cache, write_animations)
+    return stages
+
+
+def _compare(baseline: dict[str, Any], results: dict[str, Any], threshold: float, min_delta: float) -> list[str]:
+    print(f'{"stage":<24} {"baseline s":>11} {"current s":>10} {"noise s":>8} {"change":>8}')
+    regressions: list[str] = []
+    for stage, timing in results['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before is None:
+            print(f'{stage:<24} {"":>11} {timing["best"]:>10.4f} {"":>8} {"new":>8}')
+            continue
+        change = timing['best'] / before['best'] - 1 if before['best'] else 0
+        # A slowdown has to stand out from the spread of both runs, and
+        # from min_delta for stages too short to time reliably.
+        noise = NOISE_FACTOR * max(t['median'] - t['best'] for t in [before, timing])
+        regressed = change > threshold and timing['best'] - before['best'] > max(noise, min_delta)
+        if regressed:
+            regressions.append(stage)
+        print(f'{stage:<24} {before["best"]:>11.4f} {timing["best"]:>10.4f} {noise:>8.4f} '
+              f'{change:>+7.1%}{" !" if regressed else ""}')
+    return regressions
+
+
+def _check(baseline_file: Path, results: dict[str, Any], threshold: float, min_delta: float) -> None:
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    if (baseline['python'], baseline['machine']) != (results['python'], results['machine']):
+        print(f'The baseline was recorded with Python {baseline["python"]} on {baseline["machine"]}; '
+              'timings only compare on the same machine.')
+    regressions = _compare(baseline, results, threshold, min_delta)
+    if regressions:
+        raise click.ClickException(f'{", ".join(regressions)} regressed by more than {threshold:.0%}')
+
+
+@cli.command()
+@click.option('--repeat', default=5, help='Runs per stage; the fastest counts, and the median gives the noise')
+@click.option('--output', type=click.Path(file_okay=True, dir_okay=False, path_type=Path),
+              help='Write the results here, e.g. to record a baseline before a change')
+@click.option('--compare', 'baseline_file', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help='Fail if a stage is slower than in this baseline')
+@click.option('--threshold', default=0.25, help='Allowed slowdown per stage, as a fraction')
+@click.option('--min-delta', default=0.002, help='Slowdowns smaller than this many seconds never fail')
+def suite(repeat: int, output: Optional[Path], baseline_file: Optional[Path], threshold: float,
+          min_delta: float) -> None:
+    """Time each backend stage on the fixture game and mods."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stages = _run_suite(repeat, Path(temp_dir))
+    results = {
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'stages': stages,
+    }
+
+    if output is not None:
+        with open(output, 'w') as f:
+            f.write(json.dumps(results, indent=4) + '\n')
+    if baseline_file is not None:
+        _check(baseline_file, results, threshold, min_delta)
+    else:
+        print(f'{"stage":<24} {"best s":>10} {"median s":>10}')
+        for stage, timing in stages.items():
+            print(f'{stage:<24} {timing["best"]:>10.4f} {timing["median"]:>10.4f}')
+
+
+@cli.command()
+@click.option('--threshold', default=0.25, help='Allowed slowdown per stage, as a fraction')
+@click.option('--min-delta', default=0.002, help='Slowdowns smaller than this many seconds never fail')
+@click.argument('baseline_file', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument('results_file', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+def compare(threshold: float, min_delta: float, baseline_file: Path, results_file: Path) -> None:
+    """Fail if any stage in RESULTS_FILE is slower than in BASELINE_FILE by more than the threshold and the noise."""
+    with open(results_file) as f:
+        results = json.load(f)
+    _check(baseline_file, results, threshold, min_delta)
+
+
+if __name__ == '__main__':
+    cli()
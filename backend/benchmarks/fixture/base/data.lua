@@ -0,0 +1,2 @@
+require("prototypes.item")
+require("prototypes.entity")
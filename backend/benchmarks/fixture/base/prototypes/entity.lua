@@ -0,0 +1,31 @@
+local function machine_animation(tint)
+  return {layers = {
+    {filename = "__base__/graphics/entity/assembler.png", width = 64, height = 64, frame_count = 8, line_length = 4,
+     tint = tint,
+     hr_version = {filename = "__base__/graphics/entity/hr-assembler.png", width = 128, height = 128, frame_count = 8,
+                   line_length = 4, scale = 0.5, tint = tint}},
+    {filename = "__base__/graphics/entity/assembler-shadow.png", width = 80, height = 48, frame_count = 8,
+     line_length = 4, draw_as_shadow = true, shift = {0.25, 0.25}},
+  }}
+end
+
+for i = 1, 12 do
+  data:extend({{
+    type = "assembling-machine", name = "assembler-" .. i, icon = "__base__/graphics/icons/gear.png", icon_size = 64,
+    icon_mipmaps = 4, crafting_categories = {"crafting"}, crafting_speed = 0.5 * i,
+    animation = machine_animation(i % 2 == 0 and {r = 0.8, g = 0.8, b = 1} or nil),
+    working_visualisations = {{animation = {filename = "__base__/graphics/entity/glow.png", width = 32, height = 32,
+                                            frame_count = 4, line_length = 4, blend_mode = "additive",
+                                            shift = {0, -0.5}}}},
+  }})
+end
+
+for i = 1, 4 do
+  data:extend({{
+    type = "lab", name = "lab-" .. i, icon = "__base__/graphics/icons/plate.png", icon_size = 64, icon_mipmaps = 4,
+    on_animation = {filename = "__base__/graphics/entity/glow.png", width = 32, height = 32, frame_count = 4,
+                    line_length = 4, frame_sequence = {1, 1, 2, 2, 3, 3, 4, 4}},
+    off_animation = {filename = "__base__/graphics/entity/glow.png", width = 32, height = 32, frame_count = 1,
+                     line_length = 4},
+  }})
+end
@@ -0,0 +1,57 @@
+-- Generated in loops so that every stage of the pipeline has enough work to
+-- time; the names only have to be unique.
+local item_count = 1200
+local gear = "__base__/graphics/icons/gear.png"
+local plate = "__base__/graphics/icons/plate.png"
+
+data:extend({
+  {type = "item-group", name = "production", icon = gear, icon_size = 64, icon_mipmaps = 4, order = "a"},
+  {type = "item-subgroup", name = "intermediate", group = "production", order = "a"},
+})
+
+for i = 1, item_count do
+  local item = {type = "item", name = "item-" .. i, subgroup = "intermediate", order = string.format("a%04d", i),
+                stack_size = 50 + i % 150, fuel_value = (i % 7) .. "MJ"}
+  if i % 3 == 0 then
+    item.icons = {
+      {icon = gear, icon_size = 64, icon_mipmaps = 4, tint = {r = (i % 10) / 10, g = 0.5, b = 0.25, a = 1}},
+      {icon = plate, icon_size = 64, icon_mipmaps = 4, scale = 0.25, shift = {8, -8}},
+    }
+  else
+    item.icon = i % 2 == 0 and gear or plate
+    item.icon_size = 64
+    item.icon_mipmaps = 4
+  end
+  data:extend({item})
+
+  local ingredients = {{"item-" .. math.max(1, i - 1), 2}}
+  if i > 10 then
+    table.insert(ingredients, {type = "item", name = "item-" .. (i - 10), amount = 1})
+  end
+  data:extend({{
+    type = "recipe", name = "item-" .. i, energy_required = 0.5 + i % 5,
+    normal = {ingredients = ingredients, results = {{type = "item", name = "item-" .. i, amount = 1 + i % 3}}},
+    expensive = {ingredients = ingredients, results = {{type = "item", name = "item-" .. i, amount = 1}}},
+  }})
+end
+
+for i = 1, item_count / 4 do
+  local effects = {}
+  for j = (i - 1) * 4 + 1, i * 4 do
+    table.insert(effects, {type = "unlock-recipe", recipe = "item-" .. j})
+  end
+  local prerequisites = {}
+  if i > 1 then
+    table.insert(prerequisites, "technology-" .. (i - 1))
+  end
+  if i > 5 then
+    table.insert(prerequisites, "technology-" .. (i - 5))
+  end
+  data:extend({{
+    type = "technology", name = "technology-" .. i, icon = gear, icon_size = 64, icon_mipmaps = 4,
+    prerequisites = prerequisites, effects = effects,
+    unit = {count = 10 * i, ingredients = {{"automation-science-pack", 1}}, time = 10 + i % 30},
+  }})
+end
+
+data.raw.item["item-1"].weird = {math.huge, -math.huge, 0.1, 3, settings.startup["fixture-speed"].value}
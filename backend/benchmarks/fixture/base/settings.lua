@@ -0,0 +1,4 @@
+data:extend({
+  {type = "bool-setting", name = "fixture-expensive", setting_type = "startup", default_value = false},
+  {type = "double-setting", name = "fixture-speed", setting_type = "startup", default_value = 1.5},
+})
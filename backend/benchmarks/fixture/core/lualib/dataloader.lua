@@ -0,0 +1,15 @@
+data = {raw = {}}
+
+function data.extend(self, otherdata)
+  if type(otherdata) ~= "table" or #otherdata == 0 then
+    error("Invalid prototype array " .. serpent.block(otherdata, {maxlevel = 1}))
+  end
+  for _, e in ipairs(otherdata) do
+    local t = data.raw[e.type]
+    if t == nil then
+      t = {}
+      data.raw[e.type] = t
+    end
+    t[e.name] = e
+  end
+end
@@ -0,0 +1,25 @@
+util = {}
+
+function util.copy(object)
+  local lookup = {}
+  local function copy(o)
+    if type(o) ~= "table" then
+      return o
+    elseif lookup[o] then
+      return lookup[o]
+    end
+    local new = {}
+    lookup[o] = new
+    for k, v in pairs(o) do
+      new[copy(k)] = copy(v)
+    end
+    return setmetatable(new, getmetatable(o))
+  end
+  return copy(object)
+end
+
+function util.by_pixel(x, y)
+  return {x / 32, y / 32}
+end
+
+return util
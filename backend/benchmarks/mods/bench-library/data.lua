@@ -0,0 +1,5 @@
+local lib = require("lib")
+
+for i = 1, 100 do
+  data:extend({lib.copy_item("item-" .. i, "library-item-" .. i)})
+end
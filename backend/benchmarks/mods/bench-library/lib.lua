@@ -0,0 +1,21 @@
+local lib = {}
+
+function lib.scale_ingredients(recipe, factor)
+  for _, difficulty in pairs({recipe, recipe.normal, recipe.expensive}) do
+    for _, ingredient in pairs(difficulty.ingredients or {}) do
+      if ingredient.amount then
+        ingredient.amount = ingredient.amount * factor
+      else
+        ingredient[2] = ingredient[2] * factor
+      end
+    end
+  end
+end
+
+function lib.copy_item(name, new_name)
+  local item = util.copy(data.raw.item[name])
+  item.name = new_name
+  return item
+end
+
+return lib
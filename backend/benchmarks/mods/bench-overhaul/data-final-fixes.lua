@@ -0,0 +1,4 @@
+for name, item in pairs(data.raw.item) do
+  item.stack_size = item.stack_size * 2
+  item.localised_description = {"", {"item-name." .. name}, " (overhauled)"}
+end
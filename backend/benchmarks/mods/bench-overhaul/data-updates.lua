@@ -0,0 +1,5 @@
+local lib = require("__bench-library__/lib")
+
+for _, recipe in pairs(data.raw.recipe) do
+  lib.scale_ingredients(recipe, 2)
+end
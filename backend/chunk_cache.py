@@ -0,0 +1,63 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional, cast
+
+import lupa.lua52
+
+
+# Compiled chunks are kept in the runtime, so a library that every mod
+# requires is compiled once, and as bytecode on disk (string.dump), so later
+# runs and other regimes only have to load them.
+_LOADER = '''
+function(contents, filename, key, cache_file, temp_file)
+    local chunk = compiled[key]
+    if chunk then
+        return chunk
+    end
+    if cache_file then
+        local f = io.open(cache_file, 'rb')
+        if f then
+            chunk = load(f:read('*a'), filename, 'b')
+            f:close()
+        end
+    end
+    if not chunk then
+        local err
+        chunk, err = load(contents, filename)
+        if not chunk then
+            error(err, 0)
+        end
+        if cache_file then
+            local f = io.open(temp_file, 'wb')
+            if f then
+                f:write(string.dump(chunk))
+                f:close()
+                os.rename(temp_file, cache_file)
+            end
+        end
+    end
+    compiled[key] = chunk
+    return chunk
+end
+'''
+
+
+class ChunkCache:
+    def __init__(self, lua: lupa.lua52.LuaRuntime, directory: Optional[Path]):
+        self.directory = directory
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+        compiled = lua.table()
+        self.loader = cast(Callable[[str, str, str, Optional[str], Optional[str]], Any],
+                           lua.eval(f'(function(compiled) return {_LOADER} end)(...)', compiled))
+        self.version = '.'.join(str(part) for part in lua.lua_version)
+
+    def load(self, contents: str, filename: str) -> Any:
+        # Bytecode is only valid for the Lua version that wrote it.
+        key = hashlib.sha256(f'{self.version}\0{filename}\0{contents}'.encode('utf-8')).hexdigest()
+        cache_file = temp_file = None
+        if self.directory is not None:
+            cache_file = str(self.directory / f'{key}.luac')
+            temp_file = f'{cache_file}.{os.getpid()}.tmp'
+        return self.loader(contents, filename, key, cache_file, temp_file)
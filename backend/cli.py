@@ -1,11 +1,13 @@
 import click
+import dataclasses
 import json
+import os
+import time
 from pathlib import Path
-from animation import get_animation_specs
-from icon import get_icon_specs
-from factorio_data import get_factorio_data
-from utils import write_animation, write_icon, sanitize_floats
-import concurrent.futures
+from typing import Any, Optional, Sequence, cast
+
+# Subcommands import what they need themselves: Pillow, lupa and the render
+# pipeline take longer to load than most of them take to run.
 
 @click.group()
 def cli() -> None:
@@ -14,50 +16,193 @@ def cli() -> None:
 
 @cli.command()
 @click.option('--mod-cache-dir', default='mod_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--data-cache-dir', default='data_cache',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Where to keep the evaluated prototype data of each mod set')
+@click.option('--mod-mirror', type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Read mod archives (<mod>_<version>.zip) from this directory instead of the mod portal')
 @click.option('--factorio-base', envvar='FACTORIO_BASE', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
 @click.option('--factorio-username', envvar='FACTORIO_USERNAME')
 @click.option('--factorio-token', envvar='FACTORIO_TOKEN')
 @click.option('--output', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
 @click.option('-q', '--quiet', is_flag=True)
+@click.option('--workers', type=int, help='Number of render workers (default: one per CPU)')
+@click.option('--backend', type=click.Choice(['thread', 'process']), default='thread',
+              help='Render icons and animations in threads or in separate processes')
+@click.option('--image-cache-mb', type=int, default=2048,
+              help='Memory budget for decoded sprite sheets, per render process')
+@click.option('--regime-jobs', type=int, default=1, help='Number of regimes to evaluate at the same time')
+@click.option('--force', is_flag=True, help='Re-evaluate and re-render everything, even if the inputs are unchanged')
+@click.option('--compact', is_flag=True, help='Write prototype data without indentation')
+@click.option('--shard', is_flag=True, help='Write prototype data as data/<type>.json files instead of one data.json')
+@click.option('--profile', type=click.Path(file_okay=True, dir_okay=False, path_type=Path),
+              help='Write a Chrome trace of where the time went to this file and print a summary')
+@click.option('--icon-atlas', type=click.Choice(['type', 'regime']),
+              help='Also pack the fixed-size icons into sheets per prototype type or per regime, under <regime>/atlas')
 @click.argument('config_file', type=click.Path(file_okay=True, dir_okay=False, path_type=Path))
-def dump_data(mod_cache_dir: Path, factorio_base: Path, factorio_username: str, factorio_token: str,
-              output: Path, quiet: bool, config_file: Path) -> None:
+def dump_data(mod_cache_dir: Path, data_cache_dir: Path, mod_mirror: Optional[Path], factorio_base: Path,
+              factorio_username: str, factorio_token: str, output: Path, quiet: bool, workers: Optional[int],
+              backend: str, image_cache_mb: int, regime_jobs: int, force: bool, compact: bool, shard: bool,
+              profile: Optional[Path], icon_atlas: Optional[str], config_file: Path) -> None:
+    import shutil
+    from assets import AssetStore
+    from atlas import AtlasIcon, write_atlases
+    from icon import ICON_SIZES
+    from manifest import RenderManifest
+    from profiling import profiler
+    from regimes import RegimeOptions, prepare_regimes
+    from render import Renderer
+
     with open(config_file) as f:
         config = json.load(f)
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures: list[concurrent.futures.Future[None]] = []
-        for regime, c in config.items():
-            (output / regime).mkdir(parents=True, exist_ok=True)
-            data, reader = get_factorio_data(factorio_base, mod_cache_dir, c["mods"], factorio_username, factorio_token, quiet)
-
-            with open(output / regime / 'data.json', 'w') as f:
-                f.write(json.dumps(sanitize_floats(data), sort_keys=True, indent=4))
+    options = RegimeOptions(factorio_base, mod_cache_dir, factorio_username, factorio_token, quiet,
+                            data_cache_dir, force, mod_mirror, compact, shard, profile is not None)
+    profiler.enabled = profile is not None
 
-            for type_name, objects in data['raw'].items():
-                (output / regime / 'icons' / type_name).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    manifests: list[RenderManifest] = []
+    atlas_icons: dict[str, list[AtlasIcon]] = {}
+    # Identical icons and animations are rendered once into the asset store
+    # and hard-linked into every regime that uses them.
+    store = AssetStore(output / 'assets', force)
+    with Renderer(backend, workers, image_cache_bytes=image_cache_mb * 1024 ** 2) as renderer:
+        for prepared in prepare_regimes(config, output, options, regime_jobs):
+            profiler.extend(prepared.events)
+            manifest = RenderManifest(output / prepared.regime, force)
+            manifests.append(manifest)
+            atlas_icons[prepared.regime] = [
+                AtlasIcon(job.prototype_type, job.prototype_name, job.spec.output_size,
+                          store.root / f'{digest}{job.filename.suffix}', digest)
+                for job, digest in prepared.jobs if job.kind == 'icon' and job.spec.output_size in ICON_SIZES]
+            stale = [(job, digest) for job, digest in prepared.jobs if not manifest.is_current(job.filename, digest)]
+            jobs = [job for job in (store.plan(job, digest) for job, digest in stale) if job is not None]
+            if not quiet:
+                print(f'{prepared.regime}: evaluated in {prepared.elapsed:.1f}s, '
+                      f'{len(stale)} of {len(prepared.jobs)} icons and animations changed, rendering {len(jobs)}')
+            renderer.submit(prepared.reader, jobs)
 
-            for type_name, objects in data['raw'].items():
-                for name, object_data in objects.items():
-                    if 'icon' in object_data or 'icons' in object_data:
-                        futures.append(executor.submit(write_icon, output / regime / 'icons' / type_name / f'{name}.png', get_icon_specs(object_data), reader))
+        with profiler.span('render', 'phase'):
+            failed = renderer.wait()
+        stats = renderer.cache_stats()
+        profiler.counter('image cache', stats)
+        if not quiet:
+            print(f'Image cache: {stats.get("hits", 0)} hits, {stats.get("misses", 0)} misses, '
+                  f'{stats.get("evictions", 0)} evictions')
 
-                    animations = get_animation_specs(object_data)
-                    if animations:
-                        base_path = (output / regime / 'animations' / type_name / name)
-                        base_path.mkdir(parents=True, exist_ok=True)
-                        for k, v in animations.items():
-                            futures.append(executor.submit(write_animation, base_path / f'{k}.webp', v, reader))
+    failed_files = store.link(failed)
+    for filename in failed_files:
+        for manifest in manifests:
+            manifest.discard(filename)
+    for manifest in manifests:
+        manifest.save()
+    store.collect_garbage(output)
 
-        concurrent.futures.wait(futures)
+    with profiler.span('icon atlases', 'phase'):
+        for regime, icons in atlas_icons.items():
+            if icon_atlas is None:
+                # The frontend prefers an atlas, so do not leave an old one behind.
+                shutil.rmtree(output / regime / 'atlas', ignore_errors=True)
+            else:
+                write_atlases(output / regime, [icon for icon in icons if icon.asset.exists()], icon_atlas)
 
     with open(output / 'config.json', 'w') as f:
         f.write(json.dumps(config, sort_keys=True, indent=4))
 
+    if not quiet:
+        print(f'Done in {time.perf_counter() - start:.1f}s')
+
+    if profile is not None:
+        profiler.write_trace(profile)
+        print(profiler.summary())
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        if lookups:
+            print(f'Image cache hit rate: {stats.get("hits", 0) / lookups:.1%}')
+
+    if failed_files:
+        if not quiet:
+            for filename, error in sorted(failed_files.items()):
+                print(f'Failed to render {filename}: {error}')
+        raise click.ClickException(f'{len(failed_files)} icons and animations failed to render')
+
 
 @cli.command()
 @click.option('--mod-cache-dir', default='mod_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
-@click.option('--factorio-base', envvar='FACTORIO_BASE', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--data-cache-dir', default='data_cache',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Where to keep the evaluated prototype data of each mod set')
+@click.option('--mod-mirror', type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Read mod archives (<mod>_<version>.zip) from this directory instead of the mod portal')
+@click.option('--factorio-base', envvar='FACTORIO_BASE',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--factorio-username', envvar='FACTORIO_USERNAME')
+@click.option('--factorio-token', envvar='FACTORIO_TOKEN')
+@click.option('--output', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('-q', '--quiet', is_flag=True)
+@click.option('--jobs', type=int, help='Number of variants to evaluate at the same time (default: one per CPU)')
+@click.option('--force', is_flag=True, help='Re-evaluate every variant, even if the inputs are unchanged')
+@click.option('--compact', is_flag=True, help='Write the variants without indentation')
+@click.argument('config_file', type=click.Path(file_okay=True, dir_okay=False, path_type=Path))
+@click.argument('regime')
+@click.argument('settings_files', nargs=-1, required=True,
+                type=click.Path(file_okay=True, dir_okay=False, exists=True, path_type=Path))
+def dump_variants(mod_cache_dir: Path, data_cache_dir: Path, mod_mirror: Optional[Path], factorio_base: Path,
+                  factorio_username: str, factorio_token: str, output: Path, quiet: bool, jobs: Optional[int],
+                  force: bool, compact: bool, config_file: Path, regime: str, settings_files: tuple[Path, ...]) -> None:
+    """Write how a regime's data changes under other startup settings.
+
+    Each SETTINGS_FILE is a mod-settings.dat or a JSON object of setting
+    names to values, and names a variant after its file name.
+    """
+    from data_writer import merge_patch, write_variants
+    from factorio_data import get_settings_variants
+    from mod_settings import read_startup_settings
+
+    with open(config_file) as f:
+        config = json.load(f)
+    if regime not in config:
+        raise click.UsageError(f'{config_file} has no regime {regime}')
+
+    variants: dict[str, dict[str, Any]] = {}
+    for settings_file in settings_files:
+        if settings_file.stem in variants:
+            raise click.UsageError(f'More than one settings file is named {settings_file.stem}')
+        try:
+            variants[settings_file.stem] = read_startup_settings(settings_file)
+        except ValueError as e:
+            raise click.ClickException(f'Cannot read {settings_file}: {e}')
+
+    start = time.perf_counter()
+    data, evaluated, _ = get_settings_variants(factorio_base, mod_cache_dir, config[regime]['mods'],
+                                               factorio_username, factorio_token, variants, quiet, data_cache_dir,
+                                               force, mod_mirror, jobs)
+
+    # Only what differs from the default data, which dump-data writes.
+    written: dict[str, dict[str, Any]] = {}
+    for name, variant in evaluated.items():
+        patch = merge_patch(data['raw'], variant.raw)
+        written[name] = {'settings': variants[name], 'raw': patch}
+        if not quiet:
+            changed = sum(len(data['raw'][type_name] if prototypes is None else prototypes)
+                          for type_name, prototypes in patch.items())
+            print(f'{name}: {changed} prototypes differ from the defaults')
+            if variant.ignored:
+                print(f'{name}: no mod defines {", ".join(variant.ignored)}; ignored')
+    write_variants(output / regime, written, compact)
+
+    if not quiet:
+        print(f'Done in {time.perf_counter() - start:.1f}s')
+
+
+@cli.command()
+@click.option('--mod-cache-dir', default='mod_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--data-cache-dir', default='data_cache',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Where to keep the evaluated prototype data of each mod set')
+@click.option('--mod-mirror', type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Read mod archives (<mod>_<version>.zip) from this directory instead of the mod portal')
+@click.option('--factorio-base', envvar='FACTORIO_BASE',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
 @click.option('--factorio-username', envvar='FACTORIO_USERNAME')
 @click.option('--factorio-token', envvar='FACTORIO_TOKEN')
 @click.option('--output', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
@@ -67,14 +212,102 @@ def dump_data(mod_cache_dir: Path, factorio_base: Path, factorio_username: str,
 @click.argument('type')
 @click.argument('name')
 def generate_animation(
-        mod_cache_dir: Path, factorio_base: Path, factorio_username: str, factorio_token: str,
-        output: Path, quiet: bool, config_file: Path, regime: str, type: str, name: str) -> None:
+        mod_cache_dir: Path, data_cache_dir: Path, mod_mirror: Optional[Path], factorio_base: Path,
+        factorio_username: str, factorio_token: str, output: Path, quiet: bool, config_file: Path, regime: str,
+        type: str, name: str) -> None:
+    from animation import FrameCache, get_animation_specs
+    from factorio_data import get_factorio_data
+    from utils import write_animation
+
     with open(config_file) as f:
         config = json.load(f)
-    data, reader = get_factorio_data(factorio_base, mod_cache_dir, config[regime]["mods"], factorio_username, factorio_token, quiet)
+    data, reader = get_factorio_data(factorio_base, mod_cache_dir, config[regime]["mods"], factorio_username,
+                                     factorio_token, quiet, data_cache_dir, mod_mirror=mod_mirror)
     object = data['raw'][type][name]
-    for name, value in get_animation_specs(object).items():
-        write_animation(output / f'{name}.webp', value, reader)
+    specs = get_animation_specs(object)
+    frame_cache = FrameCache(specs.values())
+    for name, value in specs.items():
+        # A single entity has no other jobs to overlap, so render its frames in parallel.
+        write_animation(output / f'{name}.webp', value, reader, os.cpu_count() or 1, frame_cache)
+
+
+@cli.command()
+@click.option('--mod-cache-dir', default='mod_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--data-cache-dir', default='data_cache',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Where to keep the evaluated prototype data of each mod set')
+@click.option('--mod-mirror', type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Read mod archives (<mod>_<version>.zip) from this directory instead of the mod portal')
+@click.option('--factorio-base', envvar='FACTORIO_BASE',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path))
+@click.option('--factorio-username', envvar='FACTORIO_USERNAME')
+@click.option('--factorio-token', envvar='FACTORIO_TOKEN')
+@click.option('--output', default='render_cache', type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Where to keep the data and renders between requests and runs')
+@click.option('-q', '--quiet', is_flag=True)
+@click.option('--image-cache-mb', type=int, default=2048, help='Memory budget for decoded sprite sheets')
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', type=int, default=8000)
+@click.argument('config_file', type=click.Path(file_okay=True, dir_okay=False, path_type=Path))
+def serve(mod_cache_dir: Path, data_cache_dir: Path, mod_mirror: Optional[Path], factorio_base: Path,
+          factorio_username: str, factorio_token: str, output: Path, quiet: bool, image_cache_mb: int, host: str,
+          port: int, config_file: Path) -> None:
+    """Serve /generated/ like dump-data's output, rendering icons and animations when they are first requested."""
+    from mod_reader import image_cache
+    from regimes import RegimeOptions
+    from server import RenderServer, serve_forever
+
+    with open(config_file) as f:
+        config = json.load(f)
+
+    image_cache.max_bytes = image_cache_mb * 1024 ** 2
+    # Data is only ever read by the frontend, which loads just the shards a page needs.
+    options = RegimeOptions(factorio_base, mod_cache_dir, factorio_username, factorio_token, quiet,
+                            data_cache_dir, False, mod_mirror, True, True, False)
+    if not quiet:
+        print(f'Serving {output} on http://{host}:{port}/generated/')
+    serve_forever(RenderServer(config, output, options), host, port)
+
+
+def _jsonable(value: object) -> Any:
+    # Specs are NamedTuples, or dataclasses such as animation layers.
+    if isinstance(value, (list, tuple)):
+        items = cast(Sequence[object], value)
+        if hasattr(items, '_fields'):
+            fields = cast(tuple[str, ...], getattr(items, '_fields'))
+            return {k: _jsonable(v) for k, v in zip(fields, items)}
+        return [_jsonable(v) for v in items]
+    if isinstance(value, dict):
+        mapping = cast(dict[object, object], value)
+        return {k: _jsonable(v) for k, v in mapping.items()}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return _jsonable(vars(value))
+    return value
+
+
+@cli.command()
+@click.option('--output', default='frontend/public/generated',
+              type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+              help='Where dump-data wrote its output')
+@click.argument('regime')
+@click.argument('type')
+@click.argument('name')
+def inspect(output: Path, regime: str, type: str, name: str) -> None:
+    """Print a prototype from the last dump, with the icon and animation specs it renders to."""
+    from animation import get_animation_specs
+    from data_writer import read_prototypes
+    from icon import get_icon_specs
+
+    prototypes = read_prototypes(output / regime, type)
+    if name not in prototypes:
+        raise click.ClickException(f'No {type} named {name} in {output / regime}')
+    prototype = prototypes[name]
+    print(json.dumps({
+        'prototype': prototype,
+        'icon': _jsonable(get_icon_specs(prototype)) if 'icon' in prototype or 'icons' in prototype else None,
+        'animations': _jsonable(get_animation_specs(prototype)),
+    }, sort_keys=True, indent=4))
+
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,69 @@
+from typing import Any, NamedTuple
+from PIL import Image, ImageChops
+
+
+class RGBA(NamedTuple):
+    r: float
+    g: float
+    b: float
+    a: float = 1
+
+
+def get_tint(a_tint: Any) -> RGBA:
+    if isinstance(a_tint, list):
+        tint = RGBA(*a_tint)
+    else:
+        tint = RGBA(a_tint['r'], a_tint['g'], a_tint['b'], a_tint.get('a', 1))
+    if tint.r > 1 or tint.g > 1 or tint.b > 1:
+        tint = RGBA(tint.r / 255, tint.g / 255, tint.b / 255, tint.a)
+    return tint
+
+
+def apply_tint(image: Image.Image, tint: RGBA) -> Image.Image:
+    # One lookup table per band, so the whole multiply happens inside Pillow
+    # instead of building a Python tuple per pixel.
+    lut: list[int] = []
+    for factor in tint:
+        lut.extend(min(255, max(0, int(value * factor))) for value in range(256))
+    return image.point(lut)
+
+
+def without_alpha(image: Image.Image) -> Image.Image:
+    # Light sprites are drawn on black and only add their colour, so their
+    # alpha is dropped before they are scaled.
+    r, g, b, _ = image.split()
+    return Image.merge('RGBA', (r, g, b, Image.new('L', image.size, 0)))
+
+
+def premultiplied(image: Image.Image) -> Image.Image:
+    # The colour a soft light adds is weighted by its own alpha; it leaves the
+    # alpha of what is under it alone.
+    r, g, b, _ = image.convert('RGBa').split()
+    return Image.merge('RGBA', (r, g, b, Image.new('L', image.size, 0)))
+
+
+def blend(background: Image.Image, image: Image.Image, blend_mode: str) -> Image.Image:
+    # https://lua-api.factorio.com/1.1.110/types/BlendMode.html
+    # Light sprites come in through without_alpha or premultiplied.
+    if blend_mode == 'normal':
+        return Image.alpha_composite(background, image)
+    if blend_mode == 'additive':
+        return ImageChops.add(background, image)
+    if blend_mode == 'additive-soft':
+        return ImageChops.screen(background, image)
+    if blend_mode == 'multiplicative':
+        # Transparent parts of the sprite must not darken anything, so it is
+        # laid over white first.
+        white = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        r, g, b, _ = ImageChops.multiply(background, Image.alpha_composite(white, image)).split()
+        return Image.merge('RGBA', (r, g, b, background.getchannel('A')))
+    raise ValueError(f'Unknown blend mode {blend_mode}')
+
+
+def add_shadow(frame: Image.Image, image: Image.Image, offset: tuple[int, int]) -> None:
+    # Shadows are drawn in black and do not stack: where two of them overlap,
+    # the darker one wins.
+    box = (offset[0], offset[1], offset[0] + image.width, offset[1] + image.height)
+    alpha = ImageChops.lighter(frame.getchannel('A').crop(box), image.getchannel('A'))
+    black = Image.new('L', image.size, 0)
+    frame.paste(Image.merge('RGBA', (black, black, black, alpha)), offset)
@@ -0,0 +1,143 @@
+import json
+import math
+import shutil
+from pathlib import Path
+from typing import Any, Optional, TextIO, cast
+
+from utils import sanitize_floats
+
+
+# data -> raw -> type -> prototype. Everything above a prototype is written
+# piece by piece; each prototype is sanitized and encoded on its own.
+STREAM_DEPTH = 3
+
+
+def _dumps(value: Any, indent: Optional[int], level: int) -> str:
+    if indent is None:
+        return json.dumps(sanitize_floats(value), sort_keys=True, separators=(',', ':'))
+    text = json.dumps(sanitize_floats(value), sort_keys=True, indent=indent)
+    # Newlines inside strings are escaped, so every raw one starts a new line
+    # that needs the enclosing objects' indentation.
+    return text.replace('\n', '\n' + ' ' * (indent * level))
+
+
+def _write(f: TextIO, value: Any, indent: Optional[int], level: int, depth: int) -> None:
+    if depth == 0 or not isinstance(value, dict) or not value:
+        f.write(_dumps(value, indent, level))
+        return
+
+    mapping = cast(dict[str, Any], value)
+    key_separator = ':' if indent is None else ': '
+    f.write('{')
+    for i, key in enumerate(sorted(mapping)):
+        if i:
+            f.write(',')
+        if indent is not None:
+            f.write('\n' + ' ' * (indent * (level + 1)))
+        f.write(json.dumps(key) + key_separator)
+        _write(f, mapping[key], indent, level + 1, depth - 1)
+    if indent is not None:
+        f.write('\n' + ' ' * (indent * level))
+    f.write('}')
+
+
+def write_json(filename: Path, value: Any, compact: bool = False, depth: int = STREAM_DEPTH) -> None:
+    # Same output as json.dumps(sanitize_floats(value), sort_keys=True,
+    # indent=4), without building a sanitized copy or the whole string.
+    with open(filename, 'w') as f:
+        _write(f, value, None if compact else 4, 0, depth)
+
+
+def read_prototypes(regime_dir: Path, type_name: str) -> dict[str, Any]:
+    # Only a shard is cheap to read; data.json has every type in it.
+    shard = regime_dir / 'data' / f'{type_name}.json'
+    if shard.exists():
+        with open(shard) as f:
+            return json.load(f)
+    with open(regime_dir / 'data.json') as f:
+        return json.load(f)['raw'].get(type_name, {})
+
+
+def write_locales(regime_dir: Path, locale: dict[str, dict[str, str]]) -> None:
+    # One compact file per language, so that a browser only downloads its own.
+    locale_dir = regime_dir / 'locale'
+    locale_dir.mkdir(parents=True, exist_ok=True)
+    for stale in locale_dir.glob('*.json'):
+        if stale.stem not in locale:
+            stale.unlink()
+    for language, entries in locale.items():
+        write_json(locale_dir / f'{language}.json', entries, compact=True)
+
+
+def write_data(regime_dir: Path, data: dict[str, Any], compact: bool = False, shard: bool = False) -> None:
+    write_locales(regime_dir, data['locale'])
+    languages = sorted(data['locale'])
+
+    shard_dir = regime_dir / 'data'
+    if not shard:
+        # The frontend prefers shards, so drop any left over from a sharded run.
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        value = {
+            'raw': data['raw'],
+            'languages': languages,
+            'mod_versions': data['mod_versions'],
+        }
+        write_json(regime_dir / 'data.json', value, compact)
+        return
+
+    (regime_dir / 'data.json').unlink(missing_ok=True)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    for stale in shard_dir.glob('*.json'):
+        stale.unlink()
+    for type_name, prototypes in data['raw'].items():
+        write_json(shard_dir / f'{type_name}.json', prototypes, compact, STREAM_DEPTH - 2)
+    index = {
+        'types': sorted(data['raw']),
+        'languages': languages,
+        'mod_versions': data['mod_versions'],
+    }
+    write_json(shard_dir / 'index.json', index, compact)
+
+
+def _same(a: Any, b: Any) -> bool:
+    # Like ==, except that NaN is the same as NaN, so an unchanged NaN
+    # property does not show up in every patch.
+    if isinstance(a, float) and isinstance(b, float):
+        return a == b or (math.isnan(a) and math.isnan(b))
+    if isinstance(a, list) and isinstance(b, list):
+        old, new = cast(list[Any], a), cast(list[Any], b)
+        return len(old) == len(new) and all(_same(x, y) for x, y in zip(old, new))
+    if isinstance(a, dict) and isinstance(b, dict):
+        old_dict, new_dict = cast(dict[Any, Any], a), cast(dict[Any, Any], b)
+        return old_dict.keys() == new_dict.keys() and all(_same(value, new_dict[key])
+                                                          for key, value in old_dict.items())
+    return a == b
+
+
+def merge_patch(old: Any, new: Any) -> Any:
+    # A JSON merge patch (RFC 7386) that turns old into new: only the keys
+    # that changed, None for the ones that are gone. Lists are replaced whole.
+    patch: dict[str, Any] = {key: None for key in old.keys() - new.keys()}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            changes = merge_patch(old[key], value)
+            if changes:
+                patch[key] = changes
+        elif not _same(old[key], value):
+            patch[key] = value
+    return patch
+
+
+def write_variants(regime_dir: Path, variants: dict[str, dict[str, Any]], compact: bool = False) -> None:
+    # variants/<name>.json for each, and variants.json with the settings of all.
+    variant_dir = regime_dir / 'variants'
+    variant_dir.mkdir(parents=True, exist_ok=True)
+    for stale in variant_dir.glob('*.json'):
+        if stale.stem not in variants:
+            stale.unlink()
+    for name, variant in variants.items():
+        write_json(variant_dir / f'{name}.json', variant, compact)
+    write_json(regime_dir / 'variants.json', {name: variant['settings'] for name, variant in variants.items()},
+               compact)
@@ -1,73 +1,88 @@
+import concurrent.futures
+import hashlib
 import json
 import lupa.lua52
+import multiprocessing
+import os
+import pickle
 import re
+import time
 from collections import defaultdict
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, NamedTuple, Optional, cast
 
+from chunk_cache import ChunkCache
 from mod_reader import ModReader
-from utils import parse_dependencies, python_to_lua_table, lua_table_to_python
+from mod_resolver import BUILTIN_MODS, resolve_load_order
+from profiling import profiler
+from utils import lua_table_converter, lua_table_to_python, parse_dependencies, python_to_lua_table
 
 
-def _populate_mod_list(reader: ModReader, mods: set[str]) -> tuple[list[str], dict[str, Any]]:
-    mods.update({'base', 'core'})
+SETTINGS_STAGES = ['settings', 'settings-updates', 'settings-final-fixes']
+DATA_STAGES = ['data', 'data-updates', 'data-final-fixes']
+
+
+def populate_mod_list(reader: ModReader, mods: set[str]) -> tuple[list[str], dict[str, Any]]:
+    """Add the mods and their dependencies to the reader; returns them in load order, and their info.json."""
+    mods.update(BUILTIN_MODS)
 
     # Get all mods including dependencies
     mod_info: dict[str, Any] = {}
-    load_order_constraints: dict[str, list[str]] = {}
     while True:
         new_mods = mods - mod_info.keys()
         if len(new_mods) == 0:
             break
 
-        for mod in new_mods:
-            reader.add_mod(mod)
-            mod_info[mod] = json.loads(reader.get_text(f'__{mod}__/info.json'))
-
-            required_dependencies: list[str] = []
-            load_order_constraints[mod] = []
-            for dependency_spec in mod_info[mod].get('dependencies', []):
+        for mod, info in reader.get_mod_infos(sorted(new_mods)).items():
+            mod_info[mod] = info
+            for dependency_spec in info.get('dependencies', []):
                 prefix, dep, _ = parse_dependencies(dependency_spec)
                 if prefix in {None, '~'}:
-                    required_dependencies.append(dep)
-                if prefix in {None, '?', '(?)'}:
-                    load_order_constraints[mod].append(dep)
-
-            mods.update(required_dependencies)
+                    mods.add(dep)
 
-    # Now order them
-    mod_list = ['core', 'base']
-    while True:
-        new_mods = {
-                mod
-                for mod in mods
-                if set(load_order_constraints[mod]).intersection(mods).issubset(mod_list)}
-        new_mods -= set(mod_list)
-        if len(new_mods) == 0:
-            break
-        mod_list.extend(new_mods)
+    # The whole dependency closure is known; fetch whatever is missing at once.
+    reader.add_mods(mods)
+    mod_info = {mod: json.loads(reader.get_text(f'__{mod}__/info.json')) for mod in mods}
 
-    return mod_list, mod_info
+    return resolve_load_order(mod_info), mod_info
 
 
-def _init_locale(reader: ModReader, mod_list: list[str]) -> dict[str, str]:
+def _parse_locale_file(text: str) -> dict[str, str]:
     locale: dict[str, str] = {}
-    for mod in mod_list:
-        prefix = ''
-        for locale_file in reader.glob(f'__{mod}__/locale/en/*.cfg'):
-            for line in reader.get_text(locale_file).splitlines():
-                if not line or line[0] in ';#':
-                    continue
-                if line.startswith('['):
-                    prefix = line[1:-1] + '.'
-                    continue
-                name, value = line.split('=', 1)
-                locale[prefix + name] = value
-
+    prefix = ''
+    for line in text.splitlines():
+        if not line or line[0] in ';#':
+            continue
+        if line.startswith('['):
+            prefix = line[1:-1] + '.'
+            continue
+        name, value = line.split('=', 1)
+        locale[prefix + name] = value
     return locale
 
 
-def _init_lua(reader: ModReader, base_dir: Path, quiet: bool) -> lupa.lua52.LuaRuntime:
+def init_locale(reader: ModReader, mod_list: list[str]) -> dict[str, dict[str, str]]:
+    """Every language's locale, merged across the mods in load order."""
+    # One listing per mod finds every language; archives answer it from
+    # their index without touching the files.
+    files = [path for mod in mod_list for path in sorted(reader.glob(f'__{mod}__/locale/*/*.cfg'))]
+
+    def parse(path: str) -> dict[str, str]:
+        return _parse_locale_file(reader.get_text(path))
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        parsed = executor.map(parse, files)
+
+        # Merged in load order, so later mods override earlier ones.
+        locales: dict[str, dict[str, str]] = defaultdict(dict)
+        for path, entries in zip(files, parsed):
+            locales[path.split('/')[-2]].update(entries)
+    return dict(sorted(locales.items()))
+
+
+def init_lua(reader: ModReader, base_dir: Path, quiet: bool,
+             chunk_cache_dir: Optional[Path] = None) -> tuple[lupa.lua52.LuaRuntime, ChunkCache]:
+    """A Lua runtime set up like the game's, with require reading through the mod reader."""
     def lua_package_searcher(require_argument: str) -> Any:
         original_require_argument = require_argument
 
@@ -105,26 +120,33 @@ def _init_lua(reader: ModReader, base_dir: Path, quiet: bool) -> lupa.lua52.LuaR
             except FileNotFoundError:
                 continue
 
-            return lua.eval(
-                '''
-                (function(new_dir_stack_entry, contents, filename, original_require_argument)
-                    return function ()
-                        table.insert(dir_stack, 1, new_dir_stack_entry)
-                        ret = load(contents, filename)(original_require_argument)
-                        table.remove(dir_stack, 1)
-                        return ret
-                    end
-                end)(...)''',
-                new_dir_stack_entry,
-                contents,
-                path,
-                original_require_argument)
+            loader = require_loader(new_dir_stack_entry, chunks.load(contents, path), original_require_argument)
+            if not profiler.enabled:
+                return loader
+
+            def profiled_loader(*args: Any) -> Any:
+                with profiler.span(path, 'lua require', group=path.split('/')[0][2:-2]):
+                    return loader(*args)
+            # require only accepts Lua functions as loaders.
+            return lua_function(profiled_loader)
 
     def lua_log(value: str) -> None:
         if not quiet:
             print(lua_table_to_python(value))
 
     lua = lupa.lua52.LuaRuntime(unpack_returned_tuples=True)
+    chunks = ChunkCache(lua, chunk_cache_dir)
+    lua_function = cast(Callable[[Callable[..., Any]], Any],
+                        lua.eval('function(f) return function(...) return f(...) end end'))
+    require_loader = cast(Callable[[str, Any, str], Any], lua.eval('''
+        function(new_dir_stack_entry, chunk, original_require_argument)
+            return function ()
+                table.insert(dir_stack, 1, new_dir_stack_entry)
+                ret = chunk(original_require_argument)
+                table.remove(dir_stack, 1)
+                return ret
+            end
+        end'''))
     serpent = (Path(__file__).parent / 'serpent.lua').read_text(encoding='utf-8')
     lua.execute('serpent = load(...)()', serpent, 'serpent')
     defines = (Path(__file__).parent / 'defines-1.1.110.lua').read_text(encoding='utf-8')
@@ -149,38 +171,49 @@ def _init_lua(reader: ModReader, base_dir: Path, quiet: bool) -> lupa.lua52.LuaR
         end
     ''')
 
-    return lua
+    return lua, chunks
 
 
-def _read_raw_data(lua: lupa.lua52.LuaRuntime, reader: ModReader, mod_list: list[str], mod_versions: dict[str, str]) -> Any:
-    def maybe_execute(path: str) -> Any:
+def _stage_runner(lua: lupa.lua52.LuaRuntime, chunks: ChunkCache, reader: ModReader,
+                  timings: dict[tuple[str, str], float]) -> Callable[..., None]:
+    # Reset package.loaded in between every module because some modules use
+    # packages with identical names.
+    execute = cast(Callable[[str, Any], None], lua.eval('''
+        function(new_dir_stack_entry, chunk)
+            dir_stack = {new_dir_stack_entry}
+            for k, v in pairs(package.loaded) do
+                package.loaded[k] = false
+            end
+            chunk()
+        end'''))
+
+    def maybe_execute(path: str, stage: Optional[str] = None) -> Any:
         try:
             text = reader.get_text(path)
         except FileNotFoundError:
             return
 
-        # Reset package.loaded in between every module because some modules use
-        # packages with identical names.
+        start = time.perf_counter()
         mod_root = path.split('/')[0] + '/'
-        lua.eval(
-            '''
-            (function(new_dir_stack_entry, contents, filename)
-                dir_stack = {new_dir_stack_entry}
-                for k, v in pairs(package.loaded) do
-                    package.loaded[k] = false
-                end
-                load(contents, filename)()
-            end)(...)''',
-            mod_root,
-            text,
-            path)
+        with profiler.span(path, 'lua', group=mod_root[2:-3], stage=stage):
+            execute(mod_root, chunks.load(text, path))
+        if stage is not None:
+            timings[stage, mod_root[2:-3]] = time.perf_counter() - start
+
+    return maybe_execute
 
+
+def _read_settings(lua: lupa.lua52.LuaRuntime, chunks: ChunkCache, reader: ModReader, mod_list: list[str],
+                   mod_versions: dict[str, str], timings: dict[tuple[str, str], float]) -> dict[str, dict[str, Any]]:
+    # Runs the settings stages; returns every setting at its default value.
+    maybe_execute = _stage_runner(lua, chunks, reader, timings)
     lua.globals()['mods'] = python_to_lua_table(lua, mod_versions)
     maybe_execute('__core__/lualib/dataloader.lua')
-    for filename in ['settings', 'settings-updates', 'settings-final-fixes']:
+    for filename in SETTINGS_STAGES:
         for mod in mod_list:
-            maybe_execute(f'__{mod}__/{filename}.lua')
-    raw_settings = lua_table_to_python(lua.globals()['data']['raw'])
+            maybe_execute(f'__{mod}__/{filename}.lua', filename)
+    with profiler.span('settings', 'convert'):
+        raw_settings = lua_table_converter(lua)(lua.globals()['data']['raw'])
 
     # Datatype: bool, int, etc.
     # Setting type: startup, runtime, etc.
@@ -191,33 +224,202 @@ def _read_raw_data(lua: lupa.lua52.LuaRuntime, reader: ModReader, mod_list: list
                 settings[data['setting_type']][setting_name] = {
                     'value': data['default_value']
                 }
+    return settings
 
-    # TODO incorporate settings from JSON or from live mod-settings:
-    # read_tree_file('.../mod-settings.dat')
-    lua.globals()['settings'] = settings
 
-    for filename in ['data', 'data-updates', 'data-final-fixes']:
+def _read_data(lua: lupa.lua52.LuaRuntime, chunks: ChunkCache, reader: ModReader, mod_list: list[str],
+               settings: dict[str, dict[str, Any]], timings: dict[tuple[str, str], float]) -> Any:
+    maybe_execute = _stage_runner(lua, chunks, reader, timings)
+    lua.globals()['settings'] = settings
+    for filename in DATA_STAGES:
         for mod in mod_list:
-            maybe_execute(f'__{mod}__/{filename}.lua')
-    return lua_table_to_python(lua.globals()['data']['raw'])
+            maybe_execute(f'__{mod}__/{filename}.lua', filename)
+    with profiler.span('data', 'convert'):
+        return lua_table_converter(lua)(lua.globals()['data']['raw'])
+
+
+def read_raw_data(lua: lupa.lua52.LuaRuntime, chunks: ChunkCache, reader: ModReader, mod_list: list[str],
+                  mod_versions: dict[str, str]) -> tuple[Any, dict[tuple[str, str], float]]:
+    """Run the settings and data stages of every mod; returns data.raw and the seconds each (stage, mod) took."""
+    timings: dict[tuple[str, str], float] = {}
+    settings = _read_settings(lua, chunks, reader, mod_list, mod_versions, timings)
+    # Startup settings other than the defaults: see get_settings_variants.
+    raw = _read_data(lua, chunks, reader, mod_list, settings, timings)
+    return raw, timings
+
+
+def _print_timings(timings: dict[tuple[str, str], float]) -> None:
+    # The three settings stages are cheap; report them as one column.
+    columns = ['settings'] + DATA_STAGES
+    per_mod: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for (stage, mod), seconds in timings.items():
+        per_mod[mod]['settings' if stage in SETTINGS_STAGES else stage] += seconds
+
+    print(f'{"mod":<40}' + ''.join(f'{column:>18}' for column in columns) + f'{"total":>10}')
+    for mod, stages in sorted(per_mod.items(), key=lambda item: -sum(item[1].values())):
+        print(f'{mod:<40}' + ''.join(f'{stages[column]:>18.3f}' for column in columns)
+              + f'{sum(stages.values()):>10.3f}')
+    totals = [sum(stages[column] for stages in per_mod.values()) for column in columns]
+    print(f'{"total":<40}' + ''.join(f'{total:>18.3f}' for total in totals) + f'{sum(totals):>10.3f}')
+
+
+def _data_cache_key(reader: ModReader, mod_list: list[str], mod_versions: dict[str, str]) -> str:
+    digest = hashlib.sha256(json.dumps([mod_list, mod_versions], sort_keys=True).encode('utf-8'))
+    for mod in mod_list:
+        digest.update(f'{mod}={reader.content_hash(mod)}\n'.encode('utf-8'))
+    # The Lua environment we set up and the code that converts its output
+    # affect the result as much as the mods do.
+    for filename in ['defines-1.1.110.lua', 'serpent.lua', 'table_to_json.lua', 'factorio_data.py', 'utils.py']:
+        digest.update(hashlib.sha256((Path(__file__).parent / filename).read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def _load_cache(cache_file: Path) -> Any:
+    with profiler.span('load data cache', 'phase'), open(cache_file, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_cache(cache_file: Path, value: Any) -> None:
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+    with profiler.span('save data cache', 'phase'), open(temp_file, 'wb') as f:
+        pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file, cache_file)
+
+
+def download_mods(base_dir: Path, mod_cache_dir: Path, mods: list[str], username: str, token: str,
+                  mod_mirror: Optional[Path] = None) -> None:
+    reader = ModReader(base_dir, mod_cache_dir, username, token, mod_mirror)
+    populate_mod_list(reader, set(mods))
 
 
 def get_factorio_data(base_dir: Path, mod_cache_dir: Path, mods: list[str],
-                      username: str, token: str, quiet: bool = False) -> Any:
-    reader = ModReader(base_dir, mod_cache_dir, username, token)
+                      username: str, token: str, quiet: bool = False,
+                      data_cache_dir: Optional[Path] = None, force: bool = False,
+                      mod_mirror: Optional[Path] = None) -> Any:
+    reader = ModReader(base_dir, mod_cache_dir, username, token, mod_mirror)
 
-    mod_list, mod_info = _populate_mod_list(reader, set(mods))
+    with profiler.span('resolve and download mods', 'phase'):
+        mod_list, mod_info = populate_mod_list(reader, set(mods))
     mod_versions = {
             name: info.get('version', None)
             for name, info in mod_info.items()}
-    locale = _init_locale(reader, mod_list)
-    lua = _init_lua(reader, base_dir, quiet)
-    raw = _read_raw_data(lua, reader, mod_list, mod_versions)
 
-    return {
+    cache_file = None
+    if data_cache_dir is not None:
+        cache_file = data_cache_dir / f'{_data_cache_key(reader, mod_list, mod_versions)}.pickle'
+        if not force and cache_file.exists():
+            return _load_cache(cache_file), reader
+
+    with profiler.span('locale', 'phase'):
+        locale = init_locale(reader, mod_list)
+    with profiler.span('evaluate Lua', 'phase'):
+        lua, chunks = init_lua(reader, base_dir, quiet, data_cache_dir / 'lua-chunks' if data_cache_dir else None)
+        raw, timings = read_raw_data(lua, chunks, reader, mod_list, mod_versions)
+    if not quiet:
+        _print_timings(timings)
+
+    data = {
         'raw': raw,
-        'locale': {
-            'en': locale,
-        },
+        'locale': locale,
         'mod_versions': mod_versions,
-    }, reader
+    }
+
+    if cache_file is not None:
+        _save_cache(cache_file, data)
+
+    return data, reader
+
+
+class SettingsVariant(NamedTuple):
+    raw: Any
+    # Overridden settings that no mod defines, which the game ignores too.
+    ignored: list[str]
+
+
+# What every forked data stages run starts from: the Lua runtime just after
+# the settings stages, and the rest of what _read_data needs.
+_variant_state: Optional[tuple[lupa.lua52.LuaRuntime, ChunkCache, ModReader, list[str],
+                               dict[str, dict[str, Any]]]] = None
+
+
+def _read_variant(overrides: dict[str, Any]) -> SettingsVariant:
+    assert _variant_state is not None
+    lua, chunks, reader, mod_list, settings = _variant_state
+    ignored = sorted(name for name in overrides if name not in settings['startup'])
+    for name, value in overrides.items():
+        if name not in ignored:
+            settings['startup'][name] = {'value': value}
+    return SettingsVariant(_read_data(lua, chunks, reader, mod_list, settings, {}), ignored)
+
+
+def get_settings_variants(base_dir: Path, mod_cache_dir: Path, mods: list[str], username: str, token: str,
+                          variants: dict[str, dict[str, Any]], quiet: bool = False,
+                          data_cache_dir: Optional[Path] = None, force: bool = False,
+                          mod_mirror: Optional[Path] = None,
+                          jobs: Optional[int] = None) -> tuple[Any, dict[str, SettingsVariant], ModReader]:
+    """Evaluate the data stages with the default startup settings, and again for each variant's overrides.
+
+    Mods are resolved, the locale is read and the settings stages are run
+    once. Every data stages run happens in a fork of the process taken at
+    that point, up to `jobs` at a time. Returns the default data as
+    get_factorio_data does, and the data.raw of each variant. Both are kept
+    in the data cache.
+    """
+    global _variant_state
+    reader = ModReader(base_dir, mod_cache_dir, username, token, mod_mirror)
+
+    with profiler.span('resolve and download mods', 'phase'):
+        mod_list, mod_info = populate_mod_list(reader, set(mods))
+    mod_versions = {
+            name: info.get('version', None)
+            for name, info in mod_info.items()}
+
+    # The default data is cached under the same name as get_factorio_data's.
+    runs: dict[Optional[str], dict[str, Any]] = {None: {}, **variants}
+    cache_files: dict[Optional[str], Path] = {}
+    if data_cache_dir is not None:
+        key = _data_cache_key(reader, mod_list, mod_versions)
+        for name, overrides in runs.items():
+            suffix = '' if name is None else '-' + hashlib.sha256(
+                json.dumps(overrides, sort_keys=True).encode('utf-8')).hexdigest()
+            cache_files[name] = data_cache_dir / f'{key}{suffix}.pickle'
+
+    results: dict[Optional[str], Any] = {}
+    if not force:
+        for name, cache_file in cache_files.items():
+            if cache_file.exists():
+                results[name] = _load_cache(cache_file)
+
+    missing = [name for name in runs if name not in results]
+    if missing:
+        locale = None
+        if None in missing:
+            with profiler.span('locale', 'phase'):
+                locale = init_locale(reader, mod_list)
+        with profiler.span('evaluate Lua', 'phase'):
+            lua, chunks = init_lua(reader, base_dir, quiet,
+                                   data_cache_dir / 'lua-chunks' if data_cache_dir else None)
+            settings = _read_settings(lua, chunks, reader, mod_list, mod_versions, {})
+            # Each run changes the Lua state, so each gets a fresh fork.
+            _variant_state = lua, chunks, reader, mod_list, settings
+            try:
+                with multiprocessing.get_context('fork').Pool(jobs, maxtasksperchild=1) as pool:
+                    evaluated = pool.map(_read_variant, [runs[name] for name in missing], chunksize=1)
+            finally:
+                _variant_state = None
+
+        for name, variant in zip(missing, evaluated):
+            if name is None:
+                results[name] = {
+                    'raw': variant.raw,
+                    'locale': locale,
+                    'mod_versions': mod_versions,
+                }
+            else:
+                results[name] = variant
+            if name in cache_files:
+                _save_cache(cache_files[name], results[name])
+
+    data = results.pop(None)
+    return data, {name: results[name] for name in variants}, reader
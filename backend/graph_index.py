@@ -0,0 +1,103 @@
+from collections import defaultdict
+from typing import Any, Iterator, Optional, cast
+
+
+def _variant(prototype: dict[str, Any]) -> dict[str, Any]:
+    # Recipes and technologies may keep their data in normal/expensive
+    # variants; like the frontend, use the normal one.
+    normal = prototype.get('normal')
+    if isinstance(normal, dict):
+        return {**prototype, **normal}
+    return prototype
+
+
+def _item_names(entries: Any) -> Iterator[str]:
+    for entry in cast(list[Any], entries or []):
+        if isinstance(entry, dict):
+            yield entry['name']
+        else:
+            yield entry[0]
+
+
+def _recipe_products(recipe: dict[str, Any]) -> Iterator[str]:
+    if 'results' in recipe:
+        yield from _item_names(recipe['results'])
+    elif 'result' in recipe:
+        yield recipe['result']
+
+
+def _closure_counts(order: list[int], edges: list[list[int]]) -> list[int]:
+    # Bitsets of everything reachable, built in an order where each node
+    # comes after all of the nodes its edges point to. Nodes outside the order
+    # are left out entirely.
+    included = set(order)
+    reachable = [0] * len(edges)
+    for node in order:
+        for other in edges[node]:
+            if other in included:
+                reachable[node] |= reachable[other] | (1 << other)
+    return [bits.bit_count() for bits in reachable]
+
+
+def build_graph_index(raw: dict[str, Any]) -> dict[str, Any]:
+    """Technology and recipe relationships, with prototypes referred to by their position in the name lists."""
+    technologies = {name: _variant(tech) for name, tech in raw.get('technology', {}).items()}
+    recipes = {name: _variant(recipe) for name, recipe in raw.get('recipe', {}).items()}
+    tech_names = sorted(technologies)
+    recipe_names = sorted(recipes)
+    tech_index = {name: i for i, name in enumerate(tech_names)}
+    recipe_index = {name: i for i, name in enumerate(recipe_names)}
+
+    prerequisites: list[list[int]] = []
+    dependents: list[list[int]] = [[] for _ in tech_names]
+    unlocked_by: list[list[int]] = [[] for _ in recipe_names]
+    blocked = [False] * len(tech_names)
+    for i, name in enumerate(tech_names):
+        tech = technologies[name]
+        prerequisite_names = sorted(set(tech.get('prerequisites') or []))
+        # A technology that needs a missing one can never be researched.
+        blocked[i] = any(p not in tech_index for p in prerequisite_names)
+        prerequisites.append([tech_index[p] for p in prerequisite_names if p in tech_index])
+        for p in prerequisites[-1]:
+            dependents[p].append(i)
+        effects = cast(list[dict[str, Any]], tech.get('effects') or [])
+        for effect in effects:
+            if effect.get('type') == 'unlock-recipe' and effect.get('recipe') in recipe_index:
+                unlocked_by[recipe_index[effect['recipe']]].append(i)
+
+    # Depth is the length of the longest prerequisite chain, which is the
+    # layer the tech tree puts a technology in. Technologies that are blocked
+    # or in a cycle never get one.
+    depth: list[Optional[int]] = [None] * len(tech_names)
+    remaining = [len(p) for p in prerequisites]
+    order = [i for i, count in enumerate(remaining) if count == 0 and not blocked[i]]
+    for i in order:
+        depth[i] = 1 + max((cast(int, depth[p]) for p in prerequisites[i]), default=-1)
+        for dependent in dependents[i]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0 and not blocked[dependent]:
+                order.append(dependent)
+
+    produced_by: dict[str, list[int]] = defaultdict(list)
+    consumed_by: dict[str, list[int]] = defaultdict(list)
+    for i, name in enumerate(recipe_names):
+        recipe = recipes[name]
+        for item in dict.fromkeys(_item_names(recipe.get('ingredients'))):
+            consumed_by[item].append(i)
+        for item in dict.fromkeys(_recipe_products(recipe)):
+            produced_by[item].append(i)
+    item_names = sorted(produced_by.keys() | consumed_by.keys())
+
+    return {
+        'technologies': tech_names,
+        'prerequisites': prerequisites,
+        'dependents': dependents,
+        'depth': depth,
+        'prerequisite_count': _closure_counts(order, prerequisites),
+        'dependent_count': _closure_counts(order[::-1], dependents),
+        'recipes': recipe_names,
+        'unlocked_by': unlocked_by,
+        'items': item_names,
+        'produced_by': [produced_by[item] for item in item_names],
+        'consumed_by': [consumed_by[item] for item in item_names],
+    }
@@ -1,14 +1,14 @@
 from typing import Any, Optional, NamedTuple
 from PIL import Image
 
+from compositing import RGBA, apply_tint, get_tint
 from mod_reader import ModReader
 
 
-class RGBA(NamedTuple):
-    r: float
-    g: float
-    b: float
-    a: float = 1
+# Icons are also rendered at whichever of these sizes are no larger than the
+# icon itself, as icons/<size>/<type>/<name>.png, so that list views do not
+# have to download and scale down the full-size icons.
+ICON_SIZES = [32, 64, 128]
 
 
 class Layer(NamedTuple):
@@ -17,40 +17,66 @@ class Layer(NamedTuple):
     scale: float = 1
     tint: Optional[RGBA] = None
     shift: tuple[float, float] = (0, 0)
+    icon_mipmaps: int = 1
 
 
 class IconSpec(NamedTuple):
     size: Optional[int]
     layers: list[Layer]
+    # The size to render at; None is the icon's own size.
+    output_size: Optional[int] = None
+
+
+def _resize(image: Image.Image, size: int) -> Image.Image:
+    if image.size == (size, size):
+        return image
+    return image.resize((size, size), Image.Resampling.LANCZOS if size < image.height else Image.Resampling.BICUBIC)
+
+
+def get_mipmap(image: Image.Image, mipmaps: int, size: int) -> Image.Image:
+    # Mipmap levels sit side by side, each half the size of the one before:
+    # a 64px icon with 4 levels is a 120x64 sheet of 64, 32, 16 and 8px
+    # squares. Use the smallest level that is at least `size` pixels.
+    x = 0
+    level_size = image.height
+    for _ in range(mipmaps - 1):
+        if level_size // 2 < size or x + level_size + level_size // 2 > image.width:
+            break
+        x += level_size
+        level_size //= 2
+    return _resize(image.crop((x, 0, x + level_size, level_size)), size)
 
 
 def get_factorio_icon(reader: ModReader, icon_spec: IconSpec) -> Image.Image:
     icon_size = icon_spec.size
-    if icon_size is None:
-        return reader.get_image(icon_spec.layers[0].icon_path)
-
-    icon = Image.new(mode='RGBA', size=(icon_size, icon_size))
+    output_size = icon_spec.output_size or icon_size
+    if icon_size is None or output_size is None:
+        image = reader.get_image(icon_spec.layers[0].icon_path)
+        if output_size is None:
+            return image
+        return get_mipmap(image, icon_spec.layers[0].icon_mipmaps, output_size)
+
+    # Layers are scaled straight to the output size, from the closest
+    # mipmap, rather than composed at full size and scaled down after.
+    factor = output_size / icon_size
+    icon = Image.new(mode='RGBA', size=(output_size, output_size))
     x1: Optional[float] = None
     x2: Optional[float] = None
     y1: Optional[float] = None
     y2: Optional[float] = None
     for icon_layer in icon_spec.layers:
-        layer = reader.get_image(icon_layer.icon_path)
-
         layer_original_size = icon_layer.icon_size or icon_size
-        layer_scaled_size = int(layer_original_size * icon_layer.scale)
+        layer_scaled_size = max(1, int(layer_original_size * icon_layer.scale * factor))
 
-        layer = layer \
-            .crop((0, 0, layer.height, layer.height)) \
-            .resize((layer_scaled_size, layer_scaled_size))
+        layer = get_mipmap(reader.get_image(icon_layer.icon_path), icon_layer.icon_mipmaps, layer_scaled_size)
 
         if icon_layer.tint is not None:
-            tint = icon_layer.tint
-            layer_new_data = [(int(data[0] * tint.r), int(data[1] * tint.g), int(data[2] * tint.b), int(data[3] * tint.a)) for data in layer.getdata()]
-            layer.putdata(layer_new_data)
+            layer = apply_tint(layer, icon_layer.tint)
 
         shift_x, shift_y = icon_layer.shift
-        default_offset = (icon_size - layer_scaled_size) / 2
+        shift_x *= factor
+        shift_y *= factor
+        default_offset = (output_size - layer_scaled_size) / 2
         shift_x += default_offset
         shift_y += default_offset
         offset = int(shift_x), int(shift_y)
@@ -72,33 +98,29 @@ def get_factorio_icon(reader: ModReader, icon_spec: IconSpec) -> Image.Image:
         return icon
 
 
-def get_layer(a_dict: Any) -> Layer:
+def get_layer(a_dict: Any, icon_mipmaps: int = 1) -> Layer:
     tint = None
     if 'tint' in a_dict:
-        a_tint = a_dict['tint']
-        if isinstance(a_dict['tint'], list):
-            tint = RGBA(*a_tint)
-        else:
-            tint = RGBA(a_tint['r'], a_tint['g'], a_tint['b'], a_tint.get('a', 1))
-        if tint.r > 1 or tint.g > 1 or tint.b > 1:
-            tint = RGBA(tint.r / 255, tint.g / 255, tint.b / 255, tint.a)
+        tint = get_tint(a_dict['tint'])
 
     return Layer(icon_path=a_dict['icon'],
                  icon_size=a_dict.get('icon_size', None),
                  scale=a_dict.get('scale', 1),
                  shift=a_dict.get('shift', (0, 0)),
-                 tint=tint)
+                 tint=tint,
+                 icon_mipmaps=a_dict.get('icon_mipmaps', icon_mipmaps))
 
 
 def get_icon_specs(a_dict: Any) -> IconSpec:
+    icon_mipmaps = a_dict.get('icon_mipmaps', 1)
     if 'icon' in a_dict:
         icon = a_dict['icon']
         if isinstance(icon, str):
-            layers = [Layer(icon_path=icon)]
+            layers = [Layer(icon_path=icon, icon_mipmaps=icon_mipmaps)]
         else:
-            layers = [Layer(icon_path=icon['filename'])]
+            layers = [Layer(icon_path=icon['filename'], icon_mipmaps=icon_mipmaps)]
     else:
-        layers = [get_layer(i) for i in a_dict['icons']]
+        layers = [get_layer(i, icon_mipmaps) for i in a_dict['icons']]
 
     size = None
     if 'icon_size' in a_dict:
@@ -110,3 +132,10 @@ def get_icon_specs(a_dict: Any) -> IconSpec:
                 break
 
     return IconSpec(size, layers)
+
+
+def get_icon_sizes(icon_spec: IconSpec) -> list[int]:
+    """The fixed sizes to render an icon at: those no larger than the icon itself."""
+    if icon_spec.size is None:
+        return []
+    return [size for size in ICON_SIZES if size <= icon_spec.size]
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Hashable, Optional
+from PIL import Image
+
+
+def image_size(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class ImageCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[Hashable, Image.Image] = OrderedDict()
+        self.size = 0
+        # A sheet larger than the whole budget is not stored with the rest,
+        # but the most recent one is kept so that the frames cut from it one
+        # after another do not each decode it again.
+        self.oversize: Optional[tuple[Hashable, Image.Image]] = None
+        # Sheets being decoded; other callers for the same key wait for them.
+        self.loading: dict[Hashable, Future[Image.Image]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, load: Callable[[], Image.Image]) -> Image.Image:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            if self.oversize is not None and self.oversize[0] == key:
+                self.hits += 1
+                return self.oversize[1]
+            future = self.loading.get(key)
+            if future is not None:
+                waiting = True
+                self.hits += 1
+            else:
+                waiting = False
+                self.misses += 1
+                future = self.loading[key] = Future()
+        if waiting:
+            return future.result()
+
+        # Decode outside the lock so that threads working on other sheets are
+        # not held up.
+        try:
+            entry = load()
+        except BaseException as e:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(e)
+            raise
+
+        size = image_size(entry)
+        with self.lock:
+            del self.loading[key]
+            if size > self.max_bytes:
+                self.oversize = key, entry
+            else:
+                self.entries[key] = entry
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= image_size(evicted)
+                    self.evictions += 1
+        future.set_result(entry)
+        return entry
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.oversize = None
+            self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bytes': self.size,
+            }
@@ -0,0 +1,48 @@
+import hashlib
+import json
+from pathlib import Path
+
+from mod_reader import ModReader
+from render import RenderJob
+
+
+# Bump when the same job would render to a different file, so earlier
+# renders are redone.
+RENDER_VERSION = 4
+
+
+def job_digest(reader: ModReader, job: RenderJob) -> str:
+    digest = hashlib.sha256(f'{RENDER_VERSION}\n{job.kind}\n{job.spec!r}\n'.encode('utf-8'))
+    for source in job.sources():
+        try:
+            fingerprint = reader.fingerprint(source)
+        except (KeyError, OSError):
+            # Let the render itself fail; the job is dropped from the manifest
+            # and retried on the next run.
+            fingerprint = 'missing'
+        digest.update(f'{source}={fingerprint}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RenderManifest:
+    def __init__(self, root: Path, force: bool = False):
+        self.root = root
+        self.path = root / 'render-manifest.json'
+        self.previous: dict[str, str] = {}
+        if not force and self.path.exists():
+            with open(self.path) as f:
+                self.previous = json.load(f)
+        self.current: dict[str, str] = {}
+
+    def is_current(self, filename: Path, digest: str) -> bool:
+        key = filename.relative_to(self.root).as_posix()
+        self.current[key] = digest
+        return self.previous.get(key) == digest and filename.exists()
+
+    def discard(self, filename: Path) -> None:
+        if filename.is_relative_to(self.root):
+            self.current.pop(filename.relative_to(self.root).as_posix(), None)
+
+    def save(self) -> None:
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(self.current, sort_keys=True, indent=4))
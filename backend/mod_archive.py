@@ -0,0 +1,107 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Generator
+from zipfile import ZipFile, ZipInfo
+
+
+# Handles each archive keeps open at most; by default as many as the render
+# thread pool has workers.
+max_handles = min(32, (os.cpu_count() or 1) + 4)
+
+
+def _glob_to_regex(pattern: str) -> re.Pattern[str]:
+    # Like glob.glob: wildcards never cross a '/'.
+    parts = [
+        '[^/]*' if part == '*' else '[^/]' if part == '?' else re.escape(part)
+        for part in re.split(r'([*?])', pattern)]
+    return re.compile(''.join(parts))
+
+
+class ModArchive:
+    def __init__(self, path: str, max_handles: int = max_handles):
+        self.path = path
+        # Open handles that are not in use. ZipFile serialises reads on a
+        # shared handle, so each reading thread gets its own, up to
+        # max_handles; further threads wait for one to be put back.
+        self.lock = threading.Lock()
+        self.handles: list[ZipFile] = []
+        self.slots = threading.BoundedSemaphore(max_handles)
+        self.closed = False
+
+        zipfile = ZipFile(path)
+        # Mod archives hold a single <mod>_<version>/ directory; index the
+        # files relative to it, the same way mods refer to them.
+        self.index: dict[str, ZipInfo] = {
+            info.filename.split('/', 1)[1]: info
+            for info in zipfile.infolist()
+            if '/' in info.filename and not info.is_dir()}
+        self.handles.append(zipfile)
+
+    @contextmanager
+    def _handle(self) -> Generator[ZipFile, None, None]:
+        with self.slots:
+            with self.lock:
+                zipfile = self.handles.pop() if self.handles else None
+            if zipfile is None:
+                zipfile = ZipFile(self.path)
+            try:
+                yield zipfile
+            finally:
+                with self.lock:
+                    if self.closed:
+                        zipfile.close()
+                    else:
+                        self.handles.append(zipfile)
+
+    def read(self, filename: str) -> bytes:
+        info = self.index.get(filename)
+        if info is None:
+            raise FileNotFoundError(f'{filename} is not in {self.path}')
+        with self._handle() as zipfile:
+            return zipfile.read(info)
+
+    def glob(self, pattern: str) -> list[str]:
+        regex = _glob_to_regex(pattern)
+        return sorted(name for name in self.index if regex.fullmatch(name))
+
+    def close(self) -> None:
+        # Handles in use are closed as they are put back.
+        with self.lock:
+            self.closed = True
+            for zipfile in self.handles:
+                zipfile.close()
+            self.handles.clear()
+
+
+_archives: dict[str, ModArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(path: str) -> ModArchive:
+    # One index and handle pool per archive for the whole process, whichever
+    # reader asks for it.
+    with _archives_lock:
+        if path not in _archives:
+            _archives[path] = ModArchive(path, max_handles)
+        return _archives[path]
+
+
+def close_archive(path: str) -> None:
+    # The next get_archive for the path opens it afresh.
+    with _archives_lock:
+        archive = _archives.pop(path, None)
+    if archive is not None:
+        archive.close()
+
+
+def _forget_archives() -> None:
+    # A forked child would otherwise share the parent's open handles, and
+    # with them the file offsets its reads depend on.
+    global _archives_lock
+    _archives.clear()
+    _archives_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_archives)
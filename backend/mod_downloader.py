@@ -0,0 +1,132 @@
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import urllib.error
+import urllib.parse
+import urllib.request
+from functools import cache
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Optional
+from zipfile import ZipFile
+
+from profiling import profiler
+
+
+MOD_PORTAL_URL = os.environ.get('FACTORIO_MOD_PORTAL', 'https://mods.factorio.com')
+USER_AGENT = ('Joey Marianer is developing a tool. Hoping not to end up eating too much bandwidth. '
+              'Manual downloads only.')
+
+
+class ModRelease(NamedTuple):
+    name: str
+    version: str
+    file_name: str
+    download_url: str
+    sha1: Optional[str]
+    info: dict[str, Any]
+
+
+def version_key(version: str) -> tuple[int, ...]:
+    return tuple(int(part) for part in version.split('.'))
+
+
+def latest_archive(directory: Path, mod: str) -> Optional[tuple[str, Path]]:
+    candidates = [
+        (match[1], path) for path in directory.glob(f'{glob.escape(mod)}_*.zip')
+        if (match := re.fullmatch(rf'{re.escape(mod)}_(\d+(?:\.\d+)*)\.zip', path.name))]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: version_key(c[0]))
+
+
+def _read_zip_info(zip_path: Path) -> dict[str, Any]:
+    with ZipFile(zip_path) as zipfile:
+        # info.json sits in the single top-level directory of the archive.
+        name = min((n for n in zipfile.namelist() if n.count('/') == 1 and n.endswith('/info.json')), key=len)
+        return json.loads(zipfile.read(name))
+
+
+class ModDownloader:
+    def __init__(self, mod_cache_dir: Path, username: str, token: str, mirror: Optional[Path] = None,
+                 max_connections: int = 4):
+        self.mod_cache_dir = Path(mod_cache_dir)
+        self.username = username
+        self.token = token
+        self.mirror = mirror
+        self.max_connections = max_connections
+
+    def _open(self, url: str, headers: Optional[dict[str, str]] = None) -> Any:
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT, **(headers or {})})
+        return urllib.request.urlopen(request)
+
+    @cache
+    def latest_release(self, mod: str) -> ModRelease:
+        if self.mirror is not None:
+            archive = latest_archive(self.mirror, mod)
+            if archive is None:
+                raise FileNotFoundError(f'{mod} is not in the mod mirror {self.mirror}')
+            version, path = archive
+            return ModRelease(mod, version, path.name, str(path), None, _read_zip_info(path))
+
+        mod_data_url = f'{MOD_PORTAL_URL}/api/mods/{urllib.parse.quote(mod, safe="")}/full'
+        with self._open(mod_data_url) as response:
+            mod_data = json.loads(response.read())
+        compatible_releases = [release for release in mod_data['releases']
+                               if release['info_json']['factorio_version'] == '1.1']
+        latest_release = compatible_releases[-1]
+        return ModRelease(mod, latest_release['version'], latest_release['file_name'],
+                          latest_release['download_url'], latest_release.get('sha1'),
+                          {'version': latest_release['version'], **latest_release['info_json']})
+
+    def fetch(self, release: ModRelease) -> Path:
+        target = self.mod_cache_dir / release.file_name
+        if target.exists():
+            return target
+        with profiler.span(release.name, 'download', group='mod archives', version=release.version):
+            return self._download(release, target)
+
+    def _download(self, release: ModRelease, target: Path) -> Path:
+        # Downloads stream into a .part file next to the target. If an earlier
+        # run was interrupted, ask the server for the rest of it.
+        part = target.with_name(target.name + '.part')
+        if self.mirror is not None:
+            with open(release.download_url, 'rb') as source, open(part, 'wb') as f:
+                shutil.copyfileobj(source, f)
+        else:
+            print(f'Downloading {release.name} {release.version}...')
+            query = urllib.parse.urlencode({'username': self.username, 'token': self.token})
+            url = f'{MOD_PORTAL_URL}{release.download_url}?{query}'
+            offset = part.stat().st_size if part.exists() else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with self._open(url, headers) as response:
+                    mode = 'ab' if offset and response.status == 206 else 'wb'
+                    with open(part, mode) as f:
+                        shutil.copyfileobj(response, f, 1024 * 1024)
+            except urllib.error.HTTPError as e:
+                # 416 means the .part file already holds the whole archive.
+                if e.code != 416:
+                    raise
+
+        if release.sha1 is not None:
+            digest = hashlib.sha1()
+            with open(part, 'rb') as f:
+                while chunk := f.read(1024 * 1024):
+                    digest.update(chunk)
+            if digest.hexdigest() != release.sha1:
+                part.unlink()
+                raise ValueError(f'Checksum mismatch for {release.file_name}')
+
+        os.replace(part, target)
+        return target
+
+    def fetch_all(self, releases: Iterable[ModRelease]) -> dict[str, Path]:
+        releases = list(releases)
+        self.mod_cache_dir.mkdir(parents=True, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            paths = executor.map(self.fetch, releases)
+            return {release.name: path for release, path in zip(releases, paths)}
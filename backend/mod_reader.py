@@ -1,71 +1,140 @@
-from functools import cache
+import concurrent.futures
+import hashlib
 import io
 import json
 import os
 import re
-import shutil
-import urllib.parse
-import urllib.request
 from glob import glob
 from PIL import Image
 from pathlib import Path
-from zipfile import ZipFile
+from typing import Any, Iterable, Optional
+
+from image_cache import ImageCache
+from mod_archive import close_archive, get_archive
+from mod_downloader import ModDownloader, latest_archive
+
+
+# Decoded images, shared by every ModReader in this process.
+image_cache = ImageCache(2 * 1024 ** 3)
+
+
+def _is_archive(mod_path: str) -> bool:
+    return mod_path.endswith('.zip')
+
+
+def _read(mod_path: str, filename: str) -> bytes:
+    if _is_archive(mod_path):
+        return get_archive(mod_path).read(filename)
+    with open(f'{mod_path}/{filename}', 'rb') as x:
+        return x.read()
 
 
 class ModReader:
-    def __init__(self, base_dir: Path, mod_cache_dir: Path, username: str, token: str):
+    def __init__(self, base_dir: Path, mod_cache_dir: Path, username: str, token: str,
+                 mod_mirror: Optional[Path] = None):
         self.mod_cache_dir = mod_cache_dir
+        # Either a directory or a mod archive, which is read without being
+        # extracted.
         self.mod_to_path = {x: f'{base_dir}/{x}' for x in ['base', 'core']}
-        self.username = username
-        self.token = token
+        self.downloader = ModDownloader(mod_cache_dir, username, token, mod_mirror)
+        self.fingerprints: dict[str, str] = {}
 
-    def add_mod(self, mod: str) -> None:
+    def _local_path(self, mod: str) -> Optional[str]:
         if mod in self.mod_to_path:
-            return
-
+            return self.mod_to_path[mod]
+        archive = latest_archive(Path(self.mod_cache_dir), mod)
+        if archive is not None:
+            return str(archive[1])
+        # Mod caches from before archives were read in place.
         target_dir = f'{self.mod_cache_dir}/{mod}'
-        self.mod_to_path[mod] = target_dir
-        if not os.path.isdir(target_dir):
-            # Attempt to download and extract the file
-            print(f'Downloading the latest version of {mod}...')
-            mod_data_url = f'https://mods.factorio.com/api/mods/{urllib.parse.quote(mod, safe="")}'
-            mod_data = json.loads(urllib.request.urlopen(mod_data_url).read())
-            compatible_releases = [release for release in mod_data['releases']
-                                   if release['info_json']['factorio_version'] == '1.1']
-            latest_release = compatible_releases[-1]
-            print(latest_release['version'])
-            download_url = latest_release['download_url']
-
-            zip_url = f'https://mods.factorio.com{download_url}?username={self.username}&token={self.token}'
-            zip_request = urllib.request.Request(
-                zip_url,
-                headers={
-                    'User-Agent': 'Joey Marianer is developing a tool. Hoping not to end up eating too much bandwidth. '
-                    'Manual downloads only.'})
-            zipfile = urllib.request.urlopen(zip_request).read()
-            zipfile = ZipFile(io.BytesIO(zipfile))
-            os.mkdir(target_dir)
-            for file_info in zipfile.filelist:
-                target_path = os.path.join(target_dir, *file_info.filename.split(os.sep)[1:])
-                if os.path.basename(target_path) == '':
-                    continue
-                os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                with zipfile.open(file_info) as source, open(target_path, "wb") as target:
-                    shutil.copyfileobj(source, target)
+        if os.path.isdir(target_dir):
+            return target_dir
+        return None
+
+    def get_mod_infos(self, mods: Iterable[str]) -> dict[str, Any]:
+        def get_mod_info(mod: str) -> Any:
+            local_path = self._local_path(mod)
+            if local_path is not None:
+                return json.loads(_read(local_path, 'info.json'))
+            # Only the metadata for now; the archive itself is fetched by
+            # add_mods once the whole dependency closure is known.
+            return self.downloader.latest_release(mod).info
+
+        mods = list(mods)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.downloader.max_connections) as executor:
+            return dict(zip(mods, executor.map(get_mod_info, mods)))
+
+    def add_mods(self, mods: Iterable[str]) -> None:
+        mods = list(mods)
+        missing = [mod for mod in mods if self._local_path(mod) is None]
+        zip_paths = self.downloader.fetch_all(self.downloader.latest_release(mod) for mod in missing)
+        for mod in mods:
+            if mod in zip_paths:
+                self.mod_to_path[mod] = str(zip_paths[mod])
+            elif mod not in self.mod_to_path:
+                local_path = self._local_path(mod)
+                assert local_path is not None
+                self.mod_to_path[mod] = local_path
+
+    def add_mod(self, mod: str) -> None:
+        self.add_mods([mod])
 
     def get_text(self, a_path: str) -> str:
         return self._get_binary(a_path).decode('utf-8')
 
-    def _get_binary(self, a_path: str) -> bytes:
+    def _split(self, a_path: str) -> tuple[str, str]:
         match = re.match('__(.*)__/(.*)', a_path)
         if not match:
-            raise
+            raise ValueError(a_path)
+        return self.mod_to_path[match[1]], match[2].lstrip('/')
 
-        mod_dir = self.mod_to_path[match[1]]
-        filename = match[2]
+    def _resolve(self, a_path: str) -> str:
+        mod_path, filename = self._split(a_path)
+        return f'{mod_path}/{filename}'
 
-        with open(f'{mod_dir}/{filename}', 'rb') as x:
-            return x.read()
+    def _get_binary(self, a_path: str) -> bytes:
+        return _read(*self._split(a_path))
+
+    def content_hash(self, mod: str, suffixes: tuple[str, ...] = ('.lua', '.cfg', '.json')) -> str:
+        mod_path = self.mod_to_path[mod]
+        digest = hashlib.sha256()
+        if _is_archive(mod_path):
+            # The central directory already has a CRC for every file, so
+            # nothing needs to be decompressed.
+            for name, info in sorted(get_archive(mod_path).index.items()):
+                if name.endswith(suffixes):
+                    digest.update(f'{name}\0{info.file_size}:{info.CRC}\0'.encode('utf-8'))
+            return digest.hexdigest()
+
+        for root, dirs, files in os.walk(mod_path):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith(suffixes):
+                    continue
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, mod_path).encode('utf-8') + b'\0')
+                with open(path, 'rb') as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def fingerprint(self, a_path: str) -> str:
+        if a_path not in self.fingerprints:
+            mod_path, filename = self._split(a_path)
+            if _is_archive(mod_path):
+                info = get_archive(mod_path).index.get(filename)
+                if info is None:
+                    raise FileNotFoundError(a_path)
+                self.fingerprints[a_path] = f'{info.file_size}:{info.CRC:08x}'
+            else:
+                stat = os.stat(f'{mod_path}/{filename}')
+                self.fingerprints[a_path] = f'{stat.st_size}:{stat.st_mtime_ns}'
+        return self.fingerprints[a_path]
+
+    def close(self) -> None:
+        """Close the archives this reader has open. It can still be used; they are opened again as needed."""
+        for mod_path in self.mod_to_path.values():
+            if _is_archive(mod_path):
+                close_archive(mod_path)
 
     def glob(self, a_glob: str) -> list[str]:
         match = re.match('__(.*)__/(.*)', a_glob)
@@ -73,18 +142,29 @@ class ModReader:
             return []
 
         game_mod = match[1]
-        mod_dir = self.mod_to_path[game_mod]
+        mod_path = self.mod_to_path[game_mod]
         filename = match[2]
 
-        return [f'__{game_mod}__/' + f.removeprefix(mod_dir)
-                for f in glob(f'{mod_dir}/{filename}')]
-
-    @cache
-    def get_image(self, path: str, alpha: bool = True) -> Image.Image:
-        image = Image \
-            .open(io.BytesIO(self._get_binary(path))) \
-            .convert('RGBA')
-        if not alpha:
-            r, g, b, _ = image.split()
-            image = Image.merge('RGBA', (r, g, b, Image.new('L', image.size, 0)))
+        if _is_archive(mod_path):
+            return [f'__{game_mod}__/{f}' for f in get_archive(mod_path).glob(filename)]
+        return [f'__{game_mod}__/' + f.removeprefix(mod_path)
+                for f in glob(f'{mod_path}/{filename}')]
+
+    def _decode_image(self, path: str) -> Image.Image:
+        image = Image.open(io.BytesIO(self._get_binary(path)))
+        if image.mode != 'RGBA':
+            return image.convert('RGBA')
+        image.load()
         return image
+
+    def get_image(self, path: str) -> Image.Image:
+        # Keyed by the file rather than the reader, so that readers for
+        # different regimes share decoded sheets.
+        return image_cache.get(self._resolve(path), lambda: self._decode_image(path))
+
+    def get_frame(self, path: str, box: tuple[int, int, int, int]) -> Image.Image:
+        # Pillow cannot decode part of a PNG, so the sheet is decoded once
+        # into the image cache and each frame is cut from it when it is asked
+        # for. Frames that hang over the sheet's edges are padded with
+        # transparency.
+        return self.get_image(path).crop(box)
@@ -0,0 +1,95 @@
+import operator
+import re
+from collections import deque
+from typing import Any, Callable, Optional
+
+from mod_downloader import version_key
+from utils import parse_dependencies
+
+
+# Always loaded first, in this order, and implicitly depended on by every mod.
+BUILTIN_MODS = ['core', 'base']
+
+_COMPARISONS: dict[str, Callable[[Any, Any], bool]] = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '=': operator.eq,
+    '>=': operator.ge,
+    '>': operator.gt,
+}
+
+
+def natural_key(name: str) -> tuple[Any, ...]:
+    # Case-insensitive, with runs of digits compared as numbers; the name
+    # itself breaks any remaining ties.
+    parts = re.split(r'(\d+)', name.lower())
+    return tuple(int(part) if i % 2 else part for i, part in enumerate(parts)) + (name,)
+
+
+def _check_version(mod: str, dependency: str, constraint: str, version: Optional[str]) -> None:
+    match = re.fullmatch(r'(<=|>=|<|>|=)\s*(\d+(?:\.\d+)*)\s*', constraint)
+    if match is None:
+        raise ValueError(f'{mod} has an invalid version constraint on {dependency}: {constraint!r}')
+    if version is None or not _COMPARISONS[match[1]](version_key(version), version_key(match[2])):
+        raise ValueError(f'{mod} requires {dependency} {match[1]} {match[2]}, but {version} is loaded')
+
+
+def _find_cycle(blocked: set[str], load_after: dict[str, list[str]]) -> list[str]:
+    # Every blocked mod waits on another blocked mod, so following those
+    # edges from anywhere must come back around.
+    path: list[str] = []
+    seen: dict[str, int] = {}
+    mod = min(blocked)
+    while mod not in seen:
+        seen[mod] = len(path)
+        path.append(mod)
+        mod = min(m for m in load_after[mod] if m in blocked)
+    return path[seen[mod]:] + [mod]
+
+
+def resolve_load_order(mod_info: dict[str, dict[str, Any]]) -> list[str]:
+    """Check every mod's dependencies and return the order to load the mods in.
+
+    Mods load after the mods they depend on, optional ones included, and in
+    rounds: each round is every mod whose dependencies have all loaded, in
+    natural name order.
+    """
+    mods = [mod for mod in sorted(mod_info) if mod not in BUILTIN_MODS]
+
+    load_after: dict[str, list[str]] = {mod: [] for mod in mods}
+    dependents: dict[str, list[str]] = {mod: [] for mod in mods}
+    for mod in mods:
+        for dependency_spec in mod_info[mod].get('dependencies', []):
+            prefix, dependency, constraint = parse_dependencies(dependency_spec)
+            present = dependency in mod_info
+            if prefix == '!':
+                if present:
+                    raise ValueError(f'{mod} is incompatible with {dependency}')
+                continue
+            if not present:
+                if prefix in {None, '~'}:
+                    raise ValueError(f'{mod} requires {dependency}, which is missing')
+                continue
+            if constraint is not None:
+                _check_version(mod, dependency, constraint, mod_info[dependency].get('version'))
+            if prefix != '~' and dependency not in BUILTIN_MODS:
+                load_after[mod].append(dependency)
+                dependents[dependency].append(mod)
+
+    # Kahn's algorithm, keeping track of the round each mod becomes ready in.
+    waiting = {mod: len(load_after[mod]) for mod in mods}
+    round_of: dict[str, int] = {}
+    ready = deque(mod for mod in mods if waiting[mod] == 0)
+    while ready:
+        mod = ready.popleft()
+        round_of[mod] = 1 + max((round_of[m] for m in load_after[mod]), default=0)
+        for dependent in dependents[mod]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                ready.append(dependent)
+
+    blocked = set(mods) - round_of.keys()
+    if blocked:
+        raise ValueError(f'Circular mod dependencies: {" -> ".join(_find_cycle(blocked, load_after))}')
+
+    return BUILTIN_MODS + sorted(mods, key=lambda mod: (round_of[mod], natural_key(mod)))
@@ -0,0 +1,95 @@
+import json
+import struct
+from pathlib import Path
+from typing import Any, cast
+
+
+# Property tree value types, as the game writes them.
+NONE, BOOL, NUMBER, STRING, LIST, DICTIONARY, SIGNED_INTEGER, UNSIGNED_INTEGER = range(8)
+
+
+class _TreeReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: str) -> tuple[Any, ...]:
+        try:
+            values = struct.unpack_from(fmt, self.data, self.offset)
+        except struct.error:
+            raise ValueError(f'File ends at offset {len(self.data)}, in the middle of a value') from None
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def string(self) -> str:
+        empty, = self.unpack('<?')
+        if empty:
+            return ''
+        # Lengths under 255 take one byte; longer ones are a 255 and then a uint32.
+        length, = self.unpack('<B')
+        if length == 255:
+            length, = self.unpack('<I')
+        value = self.data[self.offset:self.offset + length]
+        if len(value) < length:
+            raise ValueError(f'File ends at offset {len(self.data)}, in the middle of a string')
+        try:
+            text = value.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise ValueError(f'String at offset {self.offset} is not UTF-8: {e}') from None
+        self.offset += length
+        return text
+
+    def tree(self) -> Any:
+        value_type, _ = self.unpack('<B?')
+        if value_type == NONE:
+            return None
+        if value_type == BOOL:
+            return self.unpack('<?')[0]
+        if value_type == NUMBER:
+            return self.unpack('<d')[0]
+        if value_type == STRING:
+            return self.string()
+        if value_type in {LIST, DICTIONARY}:
+            count, = self.unpack('<I')
+            # List items have (empty) keys as well.
+            items = [(self.string(), self.tree()) for _ in range(count)]
+            return [value for _, value in items] if value_type == LIST else dict(items)
+        if value_type == SIGNED_INTEGER:
+            return self.unpack('<q')[0]
+        if value_type == UNSIGNED_INTEGER:
+            return self.unpack('<Q')[0]
+        raise ValueError(f'Unknown property tree type {value_type} at offset {self.offset - 2}')
+
+
+def read_tree_file(filename: Path) -> Any:
+    """Read a property tree file such as mod-settings.dat, as written by 0.17 and later."""
+    reader = _TreeReader(filename.read_bytes())
+    # The version of the game that wrote it, and a byte that is always zero.
+    reader.unpack('<4H?')
+    return reader.tree()
+
+
+def _startup_values(tree: object) -> dict[str, Any]:
+    # {'startup': {name: {'value': value}}, 'runtime-global': ..., 'runtime-per-user': ...}
+    if not isinstance(tree, dict):
+        raise ValueError('Expected a dictionary of setting types')
+    startup = cast(dict[str, object], tree).get('startup', {})
+    if not isinstance(startup, dict):
+        raise ValueError('Expected the startup settings in a dictionary')
+    values: dict[str, Any] = {}
+    for name, setting in cast(dict[str, object], startup).items():
+        if not isinstance(setting, dict) or 'value' not in setting:
+            raise ValueError(f'Startup setting {name} has no value')
+        values[name] = cast(dict[str, Any], setting)['value']
+    return values
+
+
+def read_startup_settings(filename: Path) -> dict[str, Any]:
+    """Startup setting values from a mod-settings.dat, or from a JSON object of setting names to values."""
+    if filename.suffix == '.dat':
+        return _startup_values(read_tree_file(filename))
+    with open(filename) as f:
+        settings: object = json.load(f)
+    if not isinstance(settings, dict):
+        raise ValueError(f'{filename} should hold a JSON object of setting names to values')
+    return cast(dict[str, Any], settings)
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Generator, Mapping
+
+
+class Profiler:
+    """Collects timed spans as Chrome trace events (chrome://tracing, ui.perfetto.dev)."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events: list[dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Generator[None, None, None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.perf_counter() - start, time.thread_time() - cpu_start, **args)
+
+    def add(self, name: str, category: str, start: float, wall: float, cpu: float, **args: Any) -> None:
+        # perf_counter is the system-wide monotonic clock on Linux, so spans
+        # from worker processes line up with the parent's.
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': wall * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+            'args': {'cpu_ms': cpu * 1e3, **args},
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def counter(self, name: str, values: Mapping[str, float]) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.events.append({'name': name, 'ph': 'C', 'ts': time.perf_counter() * 1e6, 'pid': os.getpid(),
+                                'args': dict(values)})
+
+    def take_events(self) -> list[dict[str, Any]]:
+        # Worker processes hand their events to the parent with their results.
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def extend(self, events: list[dict[str, Any]]) -> None:
+        with self.lock:
+            self.events.extend(events)
+
+    def write_trace(self, filename: Path) -> None:
+        with self.lock:
+            events = list(self.events)
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self) -> str:
+        totals: dict[tuple[str, str], list[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        with self.lock:
+            for event in self.events:
+                if event['ph'] != 'X':
+                    continue
+                total = totals[event['cat'], event['args'].get('group', event['name'])]
+                total[0] += 1
+                total[1] += event['dur'] / 1e6
+                total[2] += event['args']['cpu_ms'] / 1e3
+
+        # Spans nest (a regime contains its phases, a phase its Lua files), so
+        # only compare rows within a category.
+        lines = [f'{"category":<16} {"name":<48} {"count":>7} {"wall s":>9} {"cpu s":>9}']
+        for (category, name), (count, wall, cpu) in sorted(totals.items(), key=lambda item: (item[0][0], -item[1][1])):
+            lines.append(f'{category:<16} {name:<48} {count:>7} {wall:>9.3f} {cpu:>9.3f}')
+        return '\n'.join(lines)
+
+
+# One per process. Disabled unless --profile is given.
+profiler = Profiler()
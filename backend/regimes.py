@@ -0,0 +1,80 @@
+import concurrent.futures
+import multiprocessing
+import time
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, Optional
+
+from data_writer import write_data, write_json
+from factorio_data import download_mods, get_factorio_data
+from graph_index import build_graph_index
+from manifest import job_digest
+from mod_reader import ModReader
+from profiling import profiler
+from render import RenderJob, get_render_jobs
+
+
+class RegimeOptions(NamedTuple):
+    factorio_base: Path
+    mod_cache_dir: Path
+    username: str
+    token: str
+    quiet: bool
+    data_cache_dir: Optional[Path]
+    force: bool
+    mod_mirror: Optional[Path]
+    compact: bool
+    shard: bool
+    profile: bool
+
+
+class PreparedRegime(NamedTuple):
+    regime: str
+    reader: ModReader
+    jobs: list[tuple[RenderJob, str]]
+    elapsed: float
+    # Profiling events recorded while preparing, for the parent process.
+    events: list[dict[str, Any]]
+
+
+def prepare_regime(regime: str, mods: list[str], regime_dir: Path, options: RegimeOptions) -> PreparedRegime:
+    # This may be a fresh worker process.
+    profiler.enabled = options.profile
+    start = time.perf_counter()
+    regime_dir.mkdir(parents=True, exist_ok=True)
+    with profiler.span(regime, 'regime'):
+        data, reader = get_factorio_data(options.factorio_base, options.mod_cache_dir, mods, options.username,
+                                         options.token, options.quiet, options.data_cache_dir, options.force,
+                                         options.mod_mirror)
+
+        with profiler.span('write data', 'phase'):
+            write_data(regime_dir, data, options.compact, options.shard)
+        with profiler.span('graph index', 'phase'):
+            write_json(regime_dir / 'graph.json', build_graph_index(data['raw']), compact=True)
+
+        with profiler.span('plan renders', 'phase'):
+            jobs = [(job, job_digest(reader, job)) for job in get_render_jobs(regime_dir, data['raw'])]
+    return PreparedRegime(regime, reader, jobs, time.perf_counter() - start, profiler.take_events())
+
+
+def prepare_regimes(config: dict[str, Any], output: Path, options: RegimeOptions,
+                    max_parallel: int = 1) -> Iterator[PreparedRegime]:
+    if max_parallel <= 1:
+        for regime, c in config.items():
+            yield prepare_regime(regime, c['mods'], output / regime, options)
+        return
+
+    # Several regimes usually share mods. Fetch them all up front so that two
+    # worker processes never download the same mod at once.
+    for c in config.values():
+        download_mods(options.factorio_base, options.mod_cache_dir, c['mods'], options.username, options.token,
+                      options.mod_mirror)
+
+    # Spawn rather than fork: the render pool may already have threads running
+    # in this process by the time a worker is started.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_parallel,
+                                                mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [
+            executor.submit(prepare_regime, regime, c['mods'], output / regime, options)
+            for regime, c in config.items()]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
@@ -0,0 +1,208 @@
+import concurrent.futures
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Optional, cast
+
+import mod_archive
+from animation import FrameCache, get_animation_specs
+from icon import get_icon_sizes, get_icon_specs
+from mod_reader import ModReader, image_cache
+from profiling import profiler
+from utils import write_animation, write_icon
+
+
+class RenderJob(NamedTuple):
+    kind: str  # 'icon' or 'animation'
+    filename: Path
+    spec: Any
+    prototype_type: str
+    prototype_name: str
+
+    def sources(self) -> list[str]:
+        if self.kind == 'icon':
+            return [layer.icon_path for layer in self.spec.layers]
+        paths: list[str] = []
+        for layer in self.spec:
+            if layer.filename:
+                paths.append(layer.filename)
+            else:
+                stripes = cast(list[dict[str, Any]], layer.stripes or [])
+                paths.extend(stripe['filename'] for stripe in stripes)
+        return paths
+
+
+class RenderFailure(NamedTuple):
+    job: RenderJob
+    # The exception as text, which pickles back from worker processes
+    # whatever the exception itself holds.
+    error: str
+
+
+def _describe_error(e: BaseException) -> str:
+    return f'{type(e).__name__}: {e}'
+
+
+def render(reader: ModReader, job: RenderJob, frame_cache: Optional[FrameCache] = None) -> None:
+    with profiler.span(job.filename.name, 'render', group=f'{job.prototype_type} {job.kind}s'):
+        if job.kind == 'icon':
+            write_icon(job.filename, job.spec, reader)
+        elif job.kind == 'animation':
+            write_animation(job.filename, job.spec, reader, frame_cache=frame_cache)
+        else:
+            raise ValueError(job.kind)
+
+
+def render_group(reader: ModReader, jobs: list[RenderJob]) -> list[RenderFailure]:
+    # The jobs of one prototype, which share a frame cache until the last of
+    # them is done. Returns the jobs that failed.
+    frame_cache = FrameCache([job.spec for job in jobs if job.kind == 'animation'])
+    failed: list[RenderFailure] = []
+    for job in jobs:
+        try:
+            render(reader, job, frame_cache)
+        except Exception as e:
+            failed.append(RenderFailure(job, _describe_error(e)))
+    return failed
+
+
+def group_jobs(jobs: Iterable[RenderJob]) -> list[list[RenderJob]]:
+    groups: dict[tuple[str, str], list[RenderJob]] = {}
+    for job in jobs:
+        groups.setdefault((job.prototype_type, job.prototype_name), []).append(job)
+    # Prototypes that read the same sprite sheets run back to back, so that the
+    # sheets are still in the image cache when the next one needs them.
+    return sorted(groups.values(), key=lambda group: [source for job in group for source in job.sources()])
+
+
+def get_prototype_jobs(regime_dir: Path, type_name: str, name: str, object_data: Any) -> list[RenderJob]:
+    jobs: list[RenderJob] = []
+    if 'icon' in object_data or 'icons' in object_data:
+        icon_spec = get_icon_specs(object_data)
+        # The full-size icon is the same job as the fixed size it matches, if
+        # any, so the asset store renders it once.
+        jobs.append(RenderJob('icon', regime_dir / 'icons' / type_name / f'{name}.png',
+                              icon_spec._replace(output_size=icon_spec.size), type_name, name))
+        for size in get_icon_sizes(icon_spec):
+            jobs.append(RenderJob('icon', regime_dir / 'icons' / str(size) / type_name / f'{name}.png',
+                                  icon_spec._replace(output_size=size), type_name, name))
+
+    base_path = regime_dir / 'animations' / type_name / name
+    for k, v in get_animation_specs(object_data).items():
+        jobs.append(RenderJob('animation', base_path / f'{k}.webp', v, type_name, name))
+    return jobs
+
+
+def get_render_jobs(regime_dir: Path, raw: dict[str, dict[str, Any]]) -> list[RenderJob]:
+    jobs: list[RenderJob] = []
+    for type_name, objects in raw.items():
+        for name, object_data in objects.items():
+            jobs.extend(get_prototype_jobs(regime_dir, type_name, name, object_data))
+    for directory in {job.filename.parent for job in jobs}:
+        directory.mkdir(parents=True, exist_ok=True)
+    return jobs
+
+
+# Readers owned by this worker process, keyed by the mods they can see. The
+# first batch for a given mod set brings a pickled reader along; later batches
+# reuse it so that its image cache stays warm.
+_worker_readers: dict[tuple[tuple[str, str], ...], ModReader] = {}
+
+
+def _init_worker(image_cache_bytes: int, profile: bool) -> None:
+    image_cache.max_bytes = image_cache_bytes
+    profiler.enabled = profile
+
+
+def _render_batch(reader: ModReader, groups: list[list[RenderJob]]
+                  ) -> tuple[list[RenderFailure], int, dict[str, int], list[dict[str, Any]]]:
+    key = tuple(sorted(reader.mod_to_path.items()))
+    reader = _worker_readers.setdefault(key, reader)
+
+    failed: list[RenderFailure] = []
+    for group in groups:
+        failed.extend(render_group(reader, group))
+    return failed, os.getpid(), image_cache.stats(), profiler.take_events()
+
+
+class Renderer:
+    def __init__(self, backend: str = 'thread', workers: Optional[int] = None, batch_size: int = 32,
+                 image_cache_bytes: Optional[int] = None):
+        self.backend = backend
+        self.batch_size = batch_size
+        if image_cache_bytes is None:
+            image_cache_bytes = image_cache.max_bytes
+        self.executor: concurrent.futures.Executor
+        if backend == 'thread':
+            image_cache.max_bytes = image_cache_bytes
+            if workers is not None:
+                mod_archive.max_handles = workers
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        elif backend == 'process':
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                                   mp_context=multiprocessing.get_context('spawn'),
+                                                                   initializer=_init_worker,
+                                                                   initargs=(image_cache_bytes, profiler.enabled))
+        else:
+            raise ValueError(backend)
+        self.futures: dict[concurrent.futures.Future[Any], list[RenderJob]] = {}
+        self.readers: list[ModReader] = []
+        self.worker_cache_stats: dict[int, dict[str, int]] = {}
+
+    def submit(self, reader: ModReader, jobs: Iterable[RenderJob]) -> None:
+        # A prototype's jobs always go to the same worker, one after another,
+        # so its animations can share frames.
+        groups = group_jobs(jobs)
+        self.readers.append(reader)
+        if self.backend == 'thread':
+            for group in groups:
+                self.futures[self.executor.submit(render_group, reader, group)] = group
+            return
+
+        batch: list[list[RenderJob]] = []
+        for group in groups:
+            batch.append(group)
+            if sum(len(g) for g in batch) >= self.batch_size:
+                self._submit_batch(reader, batch)
+                batch = []
+        if batch:
+            self._submit_batch(reader, batch)
+
+    def _submit_batch(self, reader: ModReader, batch: list[list[RenderJob]]) -> None:
+        self.futures[self.executor.submit(_render_batch, reader, batch)] = [job for group in batch for job in group]
+
+    def wait(self) -> list[RenderFailure]:
+        failed: list[RenderFailure] = []
+        for future in concurrent.futures.as_completed(self.futures):
+            error = future.exception()
+            if error is not None:
+                failed.extend(RenderFailure(job, _describe_error(error)) for job in self.futures[future])
+            elif self.backend == 'thread':
+                failed.extend(future.result())
+            else:
+                batch_failed, pid, stats, events = future.result()
+                failed.extend(batch_failed)
+                self.worker_cache_stats[pid] = stats
+                profiler.extend(events)
+        self.futures = {}
+        return failed
+
+    def cache_stats(self) -> dict[str, int]:
+        if self.backend == 'thread':
+            return image_cache.stats()
+        total: dict[str, int] = {}
+        for stats in self.worker_cache_stats.values():
+            for k, v in stats.items():
+                total[k] = total.get(k, 0) + v
+        return total
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+        for reader in self.readers:
+            reader.close()
+
+    def __enter__(self) -> 'Renderer':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.shutdown()
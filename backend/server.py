@@ -0,0 +1,209 @@
+import concurrent.futures
+import json
+import os
+import threading
+import urllib.parse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+from data_writer import write_data, write_json
+from factorio_data import get_factorio_data
+from graph_index import build_graph_index
+from manifest import job_digest
+from mod_reader import ModReader
+from regimes import RegimeOptions
+from render import RenderJob, get_prototype_jobs, render
+
+
+T = TypeVar('T')
+
+CONTENT_TYPES = {
+    '.json': 'application/json',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+}
+
+
+class InFlight:
+    """Runs one call per key at a time; callers for a key that is already running wait for its result."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.running: dict[str, concurrent.futures.Future[Any]] = {}
+
+    def run(self, key: str, fn: Callable[[], T]) -> T:
+        with self.lock:
+            future = self.running.get(key)
+            if future is not None:
+                waiting = True
+            else:
+                waiting = False
+                future = self.running[key] = concurrent.futures.Future()
+        if waiting:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.running[key]
+
+
+class RenderServer:
+    """Serves what dump-data would write for each regime, rendering icons and animations on first request.
+
+    A regime is evaluated when it is first asked for, then its data and mod
+    reader stay in memory. Renders go into <output>/assets/<hash>.png|webp,
+    keyed like dump-data's asset store, so they survive restarts and are
+    redone once their spec or source images change.
+    """
+
+    def __init__(self, config: dict[str, Any], output: Path, options: RegimeOptions):
+        self.config = config
+        self.output = output
+        self.options = options
+        self.assets = output / 'assets'
+        self.assets.mkdir(parents=True, exist_ok=True)
+        self.regimes: dict[str, tuple[dict[str, Any], ModReader]] = {}
+        self.in_flight = InFlight()
+
+    def regime(self, regime: str) -> tuple[dict[str, Any], ModReader]:
+        if regime not in self.regimes:
+            self.in_flight.run(f'regime {regime}', lambda: self._load(regime))
+        return self.regimes[regime]
+
+    def _load(self, regime: str) -> None:
+        if regime in self.regimes:
+            return
+        options = self.options
+        data, reader = get_factorio_data(options.factorio_base, options.mod_cache_dir, self.config[regime]['mods'],
+                                         options.username, options.token, options.quiet, options.data_cache_dir,
+                                         options.force, options.mod_mirror)
+        regime_dir = self.output / regime
+        regime_dir.mkdir(parents=True, exist_ok=True)
+        write_data(regime_dir, data, options.compact, options.shard)
+        write_json(regime_dir / 'graph.json', build_graph_index(data['raw']), compact=True)
+        self.regimes[regime] = data, reader
+
+    def find_job(self, regime: str, parts: list[str]) -> Optional[RenderJob]:
+        # icons/<type>/<name>.png, icons/<size>/<type>/<name>.png or
+        # animations/<type>/<name>/<key>.webp
+        if parts[0] == 'icons' and len(parts) == 3 and parts[2].endswith('.png'):
+            type_name, name = parts[1], parts[2][:-len('.png')]
+        elif parts[0] == 'icons' and len(parts) == 4 and parts[3].endswith('.png'):
+            type_name, name = parts[2], parts[3][:-len('.png')]
+        elif parts[0] == 'animations' and len(parts) == 4:
+            type_name, name = parts[1], parts[2]
+        else:
+            return None
+
+        data, _ = self.regime(regime)
+        prototypes = data['raw'].get(type_name, {})
+        if name not in prototypes:
+            return None
+        regime_dir = self.output / regime
+        filename = regime_dir.joinpath(*parts)
+        for job in get_prototype_jobs(regime_dir, type_name, name, prototypes[name]):
+            if job.filename == filename:
+                return job
+        return None
+
+    def asset(self, regime: str, job: RenderJob) -> Path:
+        _, reader = self.regime(regime)
+        digest = job_digest(reader, job)
+        asset = self.assets / f'{digest}{job.filename.suffix}'
+        if not asset.exists():
+            # The same asset may be asked for by several pages, or by several
+            # regimes; it is rendered once and the others wait for it.
+            self.in_flight.run(digest, lambda: self._render(reader, job, asset))
+        return asset
+
+    def _render(self, reader: ModReader, job: RenderJob, asset: Path) -> None:
+        if asset.exists():
+            return
+        # Never serve a half-written file: render next to it and move it in place.
+        temp = asset.with_name(f'.{asset.stem}.{os.getpid()}{asset.suffix}')
+        try:
+            render(reader, job._replace(filename=temp))
+            os.replace(temp, asset)
+        finally:
+            temp.unlink(missing_ok=True)
+
+    def resolve(self, path: str) -> Optional[Path]:
+        """The file to answer a request for /generated/<path> with, or None if there is none."""
+        parts = path.split('/')
+        if not path or any(part in {'', '.', '..'} for part in parts):
+            return None
+        if parts[0] not in self.config:
+            return None
+        regime, rest = parts[0], parts[1:]
+        if rest and rest[0] in {'icons', 'animations'}:
+            job = self.find_job(regime, rest)
+            return None if job is None else self.asset(regime, job)
+        self.regime(regime)
+        filename = self.output.joinpath(*parts)
+        return filename if filename.is_file() else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    @property
+    def render_server(self) -> RenderServer:
+        assert isinstance(self.server, _HTTPServer)
+        return self.server.render_server
+
+    def do_GET(self) -> None:
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if not path.startswith('/generated/'):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        path = path[len('/generated/'):]
+
+        if path == 'config.json':
+            self._send(json.dumps(self.render_server.config, sort_keys=True, indent=4).encode('utf-8'),
+                       '.json')
+            return
+        try:
+            filename = self.render_server.resolve(path)
+        except Exception as e:
+            self.log_error('%s: %r', path, e)
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, explain=repr(e))
+            return
+        if filename is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        self._send(filename.read_bytes(), filename.suffix)
+
+    def _send(self, body: bytes, suffix: str) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', CONTENT_TYPES.get(suffix, 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(body)))
+        # Renders change whenever the mods do, under the same URL.
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_request(self, code: Any = '-', size: Any = '-') -> None:
+        # Errors are still logged.
+        if not self.render_server.options.quiet:
+            super().log_request(code, size)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], render_server: RenderServer):
+        super().__init__(address, _Handler)
+        self.render_server = render_server
+
+
+def serve_forever(render_server: RenderServer, host: str, port: int) -> None:
+    with _HTTPServer((host, port), render_server) as httpd:
+        httpd.serve_forever()
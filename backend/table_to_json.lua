@@ -0,0 +1,162 @@
+-- Serializes a Lua table to JSON in one pass, producing exactly what
+-- utils.lua_table_to_python would: tables whose keys are all integers (or
+-- booleans) become lists of their values, everything else becomes an object
+-- with stringified keys, both in pairs() order. Numbers that lupa would hand to
+-- Python as int are written as integers.
+
+local format, gsub, concat, floor, huge = string.format, string.gsub, table.concat, math.floor, math.huge
+local pairs, type, tonumber, tostring, error = pairs, type, tonumber, tostring, error
+
+local escapes = {['"'] = '\\"', ['\\'] = '\\\\'}
+for byte = 0, 31 do
+    escapes[string.char(byte)] = format('\\u%04x', byte)
+end
+escapes['\127'] = '\\u007f'
+
+local function is_int(n)
+    return n == floor(n) and n >= -2^63 and n < 2^63
+end
+
+local function number_to_json(n)
+    if is_int(n) then
+        return format('%d', n)
+    elseif n ~= n then
+        return 'NaN'
+    elseif n == huge then
+        return 'Infinity'
+    elseif n == -huge then
+        return '-Infinity'
+    end
+    return format('%.17g', n)
+end
+
+local function key_to_string(k)
+    local t = type(k)
+    if t == 'string' then
+        return k
+    elseif t == 'boolean' then
+        return k and 'True' or 'False'
+    elseif t == 'number' then
+        if is_int(k) then
+            return format('%d', k)
+        elseif k == huge then
+            return 'inf'
+        elseif k == -huge then
+            return '-inf'
+        end
+        -- Shortest representation that reads back as the same number, like
+        -- Python's str(float).
+        for precision = 1, 17 do
+            local s = format('%.' .. precision .. 'g', k)
+            if tonumber(s) == k then
+                if not s:find('[.e]') then
+                    s = s .. '.0'
+                end
+                return s
+            end
+        end
+    end
+    error('cannot convert key of type ' .. t)
+end
+
+-- Prototypes repeat the same keys and many of the same values over and over;
+-- converting each distinct one once saves most of the work.
+local quoted, numbers, quoted_keys = {}, {}, {}
+
+local function quote(s)
+    local q = quoted[s]
+    if not q then
+        q = '"' .. gsub(s, '[%c"\\]', escapes) .. '"'
+        quoted[s] = q
+    end
+    return q
+end
+
+local function quote_key(k)
+    local q = quoted_keys[k]
+    if not q then
+        q = quote(key_to_string(k)) .. ':'
+        quoted_keys[k] = q
+    end
+    return q
+end
+
+local function scalar(v, t)
+    if t == 'string' then
+        return quoted[v] or quote(v)
+    elseif t == 'number' then
+        if v ~= v then
+            return 'NaN'
+        end
+        local s = numbers[v]
+        if not s then
+            s = number_to_json(v)
+            numbers[v] = s
+        end
+        return s
+    elseif t == 'boolean' then
+        return v and 'true' or 'false'
+    end
+    error('cannot convert value of type ' .. t)
+end
+
+local function write_table(out, n, t)
+    local is_list = true
+    for k in pairs(t) do
+        local kt = type(k)
+        if not (kt == 'boolean' or (kt == 'number' and is_int(k))) then
+            is_list = false
+            break
+        end
+    end
+
+    local separator = ''
+    if is_list then
+        n = n + 1
+        out[n] = '['
+        for _, v in pairs(t) do
+            n = n + 1
+            out[n] = separator
+            separator = ','
+            local vt = type(v)
+            if vt == 'table' then
+                n = write_table(out, n, v)
+            else
+                n = n + 1
+                out[n] = scalar(v, vt)
+            end
+        end
+        n = n + 1
+        out[n] = ']'
+    else
+        n = n + 1
+        out[n] = '{'
+        for k, v in pairs(t) do
+            n = n + 1
+            out[n] = separator
+            separator = ','
+            n = n + 1
+            out[n] = quoted_keys[k] or quote_key(k)
+            local vt = type(v)
+            if vt == 'table' then
+                n = write_table(out, n, v)
+            else
+                n = n + 1
+                out[n] = scalar(v, vt)
+            end
+        end
+        n = n + 1
+        out[n] = '}'
+    end
+    return n
+end
+
+return function(value)
+    local t = type(value)
+    if t ~= 'table' then
+        return value == nil and 'null' or scalar(value, t)
+    end
+    local out = {}
+    write_table(out, 0, value)
+    return concat(out)
+end
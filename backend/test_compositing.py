@@ -0,0 +1,49 @@
+import pytest
+from PIL import Image
+
+from compositing import add_shadow, blend, premultiplied, without_alpha
+
+
+def pixel(image: Image.Image) -> tuple[int, ...]:
+    return image.getpixel((0, 0))  # type: ignore[return-value]
+
+
+def solid(colour: tuple[int, int, int, int]) -> Image.Image:
+    return Image.new('RGBA', (1, 1), colour)
+
+
+def test_normal() -> None:
+    assert pixel(blend(solid((0, 0, 255, 255)), solid((255, 0, 0, 128)), 'normal')) == (128, 0, 127, 255)
+
+
+def test_additive() -> None:
+    light = without_alpha(solid((100, 50, 200, 128)))
+    assert pixel(blend(solid((100, 100, 100, 200)), light, 'additive')) == (200, 150, 255, 200)
+
+
+def test_additive_soft() -> None:
+    # Premultiplied: half of (200, 100, 0) is screened over the background.
+    light = premultiplied(solid((200, 100, 0, 128)))
+    assert pixel(light) == (100, 50, 0, 0)
+    assert pixel(blend(solid((100, 100, 100, 200)), light, 'additive-soft')) == (161, 131, 100, 200)
+
+
+def test_multiplicative() -> None:
+    background = solid((200, 100, 50, 200))
+    assert pixel(blend(background, solid((128, 255, 0, 255)), 'multiplicative')) == (100, 100, 0, 200)
+    # Transparent parts of the sprite leave the background alone.
+    assert pixel(blend(background, solid((0, 0, 0, 0)), 'multiplicative')) == (200, 100, 50, 200)
+
+
+def test_unknown_blend_mode() -> None:
+    with pytest.raises(ValueError):
+        blend(solid((0, 0, 0, 0)), solid((0, 0, 0, 0)), 'subtractive')
+
+
+def test_shadow() -> None:
+    frame = Image.new('RGBA', (2, 1))
+    add_shadow(frame, Image.new('RGBA', (2, 1), (255, 0, 0, 100)), (0, 0))
+    add_shadow(frame, solid((0, 255, 0, 60)), (1, 0))
+    # Drawn in black, and overlapping shadows keep the darker alpha.
+    assert frame.getpixel((0, 0)) == (0, 0, 0, 100)
+    assert frame.getpixel((1, 0)) == (0, 0, 0, 100)
@@ -1,18 +1,26 @@
 import base64
 import io
+import itertools
+import json
 import re
-from lupa.lua52 import LuaRuntime
-from typing import Any, cast
+from lupa.lua52 import LuaError, LuaRuntime
+from typing import Any, Callable, Optional, cast
+from PIL import _webp
 from PIL.Image import Image
 from pathlib import Path
 from icon import IconSpec, get_factorio_icon
 from mod_reader import ModReader
-from animation import get_animation, Layer
+from animation import FrameCache, get_animation_frames, Layer
 import math
 
 
 LuaObject = Any
 
+# Pillow's defaults for animated WebP: transparent black behind the frames,
+# lossy at quality 80.
+WEBP_BACKGROUND = 0
+WEBP_QUALITY = 80
+
 
 def sanitize_floats(obj: Any) -> Any:
     if isinstance(obj, dict):
@@ -39,6 +47,24 @@ def lua_table_to_python(obj: LuaObject) -> Any:
             return {str(k): lua_table_to_python(v) for k, v in obj.items()}
 
 
+def lua_table_converter(lua: LuaRuntime) -> Callable[[LuaObject], Any]:
+    # Serialising the table to JSON inside Lua crosses into Python once instead
+    # of several times per table, and gives the same result as
+    # lua_table_to_python.
+    source = (Path(__file__).parent / 'table_to_json.lua').read_text(encoding='utf-8')
+    table_to_json = cast(Callable[[LuaObject], str], lua.execute('return load(...)()', source, 'table_to_json'))
+
+    def convert(obj: LuaObject) -> Any:
+        try:
+            return json.loads(table_to_json(obj))
+        except (LuaError, ValueError):
+            # Values JSON can't carry, such as strings that aren't UTF-8; take
+            # the slow path so they come out exactly as before.
+            return lua_table_to_python(obj)
+
+    return convert
+
+
 def python_to_lua_table(lua: LuaRuntime, obj: Any) -> LuaObject:
     if isinstance(obj, dict):
         obj = cast(dict[Any, Any], obj)
@@ -63,13 +89,13 @@ def image_to_data_url(image: Image) -> str:
     return 'data:image/jpeg;base64,' + encoded
 
 
-def parse_dependencies(dependency_spec: str) -> tuple[str, str, str]:
+def parse_dependencies(dependency_spec: str) -> tuple[Optional[str], str, Optional[str]]:
     # ! for incompatibility
     # ? for an optional dependency
     # (?) for a hidden optional dependency
     # ~ for a dependency that does not affect load order
     # or no prefix for a hard requirement for the other mod.
-    match = re.match(r'^(?P<prefix>!|\?|\(\?\)|~)? \s* (?P<mod>.+?) \s* (?P<rest>[=>].*)?$',
+    match = re.match(r'^(?P<prefix>!|\?|\(\?\)|~)? \s* (?P<mod>.+?) \s* (?P<rest>[<=>].*)?$',
                      dependency_spec, re.VERBOSE)
     if match:
         return match['prefix'], match['mod'], match['rest']
@@ -82,8 +108,20 @@ def write_icon(filename: Path, icon_spec: IconSpec, data_reader: ModReader) -> N
     icon.save(filename)
 
 
-def write_animation(filename: Path, animation_spec: list[Layer], data_reader: ModReader) -> None:
-    animation = get_animation(data_reader, animation_spec)
-    image_iter = iter(animation)
-    first_image = next(image_iter)
-    first_image.save(filename, save_all=True, append_images=image_iter, optimize=True)
\ No newline at end of file
+def write_animation(filename: Path, animation_spec: list[Layer], data_reader: ModReader, workers: int = 1,
+                    frame_cache: Optional[FrameCache] = None) -> None:
+    durations, frames = get_animation_frames(data_reader, animation_spec, workers, frame_cache)
+    first_image = next(frames)
+    if len(durations) == 1:
+        first_image.save(filename)
+        return
+    # Image.save(save_all=True) lists every frame before it starts encoding,
+    # so the frames go to Pillow's WebP encoder one at a time instead, with
+    # the same settings it uses, and each is dropped once it is added.
+    encoder = _webp.WebPAnimEncoder(first_image.size, WEBP_BACKGROUND, 0, False, 3, 5, False, False)
+    timestamp = 0
+    for frame, duration in zip(itertools.chain([first_image], frames), durations):
+        encoder.add(frame.getim(), timestamp, False, WEBP_QUALITY, 100, 0)
+        timestamp += duration
+    encoder.add(None, timestamp, False, WEBP_QUALITY, 100, 0)
+    filename.write_bytes(encoder.assemble('', '', ''))
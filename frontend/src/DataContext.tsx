@@ -2,13 +2,20 @@ import React, { createContext, useState, useEffect, useContext } from 'react';
 
 const DataContext = createContext<any>(null);
 
-export function DataProvider({ path, children, fn }: { path: string; children: React.ReactNode; fn?: (foo: any) => any }) {
+const fetchJson = (path: string) => fetch(path).then(res => res.json());
+
+export function DataProvider({ path, children, fn, load = fetchJson }: {
+  path: string;
+  children: React.ReactNode;
+  fn?: (foo: any) => any;
+  load?: (path: string) => Promise<any>;
+}) {
   const [data, setData] = useState<any>(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     async function loadData() {
-      const data = await fetch(path).then(res => res.json());
+      const data = await load(path);
       if (fn) {
         setData(fn(data));
       } else {
@@ -18,7 +25,7 @@ export function DataProvider({ path, children, fn }: { path: string; children: R
     };
 
     loadData();
-  }, [path, fn]);
+  }, [path, fn, load]);
 
   if (loading) {
     return <div>Loading...</div>;
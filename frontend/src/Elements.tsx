@@ -1,12 +1,70 @@
 import React from 'react';
 import { Link, useParams } from 'react-router-dom';
+import { useData } from './DataContext';
+import { FactorioData } from './FactorioData';
 import { Item, ItemWithCount, Recipe } from './FactorioTypes';
 import { RenderItemWithCount } from './item';
 
+// The backend renders every icon at its own size and at those of these sizes
+// that are no larger.
+export type IconSize = 32 | 64 | 128;
+
+export function iconUrl(regime: string | undefined, type: string, name: string, size?: IconSize) {
+  return `/generated/${regime}/icons/${size ? `${size}/` : ''}${type}/${name}.png`;
+}
+
+// Shown size x size CSS pixels: cut from the atlas sheets when the backend
+// wrote them, so that a page full of icons costs a few requests; else its
+// own file. High-DPI screens get the icon at twice the size where there is one.
+export function Icon({ type, name, size, className }: {
+  type: string;
+  name: string;
+  size: IconSize;
+  className?: string;
+}) {
+  const { regime } = useParams();
+  const { atlas } = useData<FactorioData>();
+  const sizes = window.devicePixelRatio > 1 ? [size * 2, size] : [size];
+  for (const drawn of sizes) {
+    const entry = atlas?.sizes[drawn];
+    const position = entry?.icons[`${type}/${name}`];
+    if (!entry || !position) {
+      continue;
+    }
+    const [sheet, x, y, width, height] = position;
+    const { file, width: sheetWidth, height: sheetHeight } = entry.sheets[sheet];
+    const scale = size / width;
+    return <span className={className} role='img' aria-label={name} style={{
+      display: 'inline-block',
+      width: size,
+      height: height * scale,
+      backgroundImage: `url(/generated/${regime}/atlas/${file})`,
+      backgroundPosition: `${-x * scale}px ${-y * scale}px`,
+      backgroundSize: `${sheetWidth * scale}px ${sheetHeight * scale}px`,
+      backgroundOrigin: 'content-box',
+      backgroundClip: 'content-box',
+      backgroundRepeat: 'no-repeat',
+    }} />;
+  }
+  // Past 64 pixels, the 2x image is the icon at its own size. Icons smaller
+  // than a size have no file at it, so they fall back to their own size.
+  const full = iconUrl(regime, type, name);
+  const double = size < 128 ? iconUrl(regime, type, name, size * 2 as IconSize) : full;
+  return <img className={className} width={size} height={size} src={iconUrl(regime, type, name, size)}
+    srcSet={`${iconUrl(regime, type, name, size)} 1x, ${double} 2x`} alt={name}
+    onError={(event) => {
+      const img = event.currentTarget;
+      if (img.srcset) {
+        img.srcset = '';
+        img.src = full;
+      }
+    }} />;
+}
+
 export function ItemIcon({ item }: { item: Item }) {
   const { regime } = useParams();
   return <Link to={`/${regime}/item/${item.name}`} key={item.name}>
-    <img className='icon' src={`/generated/${regime}/icons/${item.type}/${item.name}.png`} alt={item.name} />
+    <Icon className='icon' type={item.type} name={item.name} size={32} />
   </Link>;
 }
 
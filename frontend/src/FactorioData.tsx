@@ -120,14 +120,120 @@ const all_entities = {
   'tile-ghost': Entity,
 }
 
+// Pages each get their own provider, so keep every file that has been fetched
+// instead of downloading it again on the next page.
+const fetched = new Map<string, Promise<any>>();
+function fetchJson(path: string): Promise<any> {
+  if (!fetched.has(path)) {
+    fetched.set(path, fetch(path).then(res => res.json()));
+  }
+  return fetched.get(path)!;
+}
+
+// Written by the backend next to the data (graph_index.py). Prototypes are
+// referred to by their position in the technologies, recipes and items lists.
+export interface GraphIndex {
+  technologies: string[];
+  prerequisites: number[][];
+  dependents: number[][];
+  depth: (number | null)[];
+  prerequisite_count: number[];
+  dependent_count: number[];
+  recipes: string[];
+  unlocked_by: number[][];
+  items: string[];
+  produced_by: number[][];
+  consumed_by: number[][];
+}
+
+// Written by dump-data --icon-atlas (atlas.py). For each icon size, the sheets
+// and where on them each '<type>/<name>' is: [sheet, x, y, width, height].
+export interface IconAtlas {
+  sizes: Record<string, {
+    sheets: { file: string; width: number; height: number }[];
+    icons: Record<string, [number, number, number, number, number]>;
+  }>;
+}
+
+// The dev server answers unknown paths with index.html.
+function isJson(response: Response) {
+  return response.ok && !!response.headers.get('content-type')?.includes('json');
+}
+
+// Without --icon-atlas there is none, and icons are their own files.
+async function fetchAtlas(regimeDir: string): Promise<IconAtlas | null> {
+  const response = await fetch(`${regimeDir}/atlas/index.json`);
+  return isJson(response) ? response.json() : null;
+}
+
+// Factorio names its locale directories like 'de', 'pt-BR' or 'zh-CN'.
+function pickLanguage(available: string[]): string {
+  for (const wanted of navigator.languages) {
+    const match = available.find(language => language.toLowerCase() === wanted.toLowerCase())
+      || available.find(language => language.toLowerCase() === wanted.split('-')[0].toLowerCase());
+    if (match) {
+      return match;
+    }
+  }
+  return 'en';
+}
+
+// Only the browser's language is downloaded, plus English for whatever it
+// does not translate.
+async function fetchLocale(regimeDir: string, available: string[]) {
+  const language = pickLanguage(available);
+  const languages = language === 'en' ? ['en'] : [language, 'en'];
+  const locales = await Promise.all(languages.map(name => fetchJson(`${regimeDir}/locale/${name}.json`)));
+  return { language, locale: Object.fromEntries(languages.map((name, i) => [name, locales[i]])) };
+}
+
+async function fetchRegimeData(regimeDir: string, types?: string[]): Promise<any> {
+  const graph = fetchJson(`${regimeDir}/graph.json`);
+  const atlas = fetchAtlas(regimeDir);
+  const index = await fetch(`${regimeDir}/data/index.json`);
+  if (!isJson(index)) {
+    const data = await fetchJson(`${regimeDir}/data.json`);
+    return { ...data, ...await fetchLocale(regimeDir, data.languages), graph: await graph, atlas: await atlas };
+  }
+  const { types: available, languages, mod_versions } = await index.json();
+  const wanted: string[] = types ? available.filter((type: string) => types.includes(type)) : available;
+  const [locale, ...shards] = await Promise.all([
+    fetchLocale(regimeDir, languages),
+    ...wanted.map(name => fetchJson(`${regimeDir}/data/${name}.json`)),
+  ]);
+  return {
+    raw: Object.fromEntries(wanted.map((type, i) => [type, shards[i]])),
+    ...locale,
+    mod_versions,
+    graph: await graph,
+    atlas: await atlas,
+  };
+}
+
+// Returns a DataProvider loader for a regime's data.json, or, if the backend
+// wrote per-type shards (dump-data --shard), for only the given prototype types.
+export function loadRegimeData(types?: string[]): (regimeDir: string) => Promise<FactorioData> {
+  const loaded = new Map<string, Promise<FactorioData>>();
+  return (regimeDir: string) => {
+    if (!loaded.has(regimeDir)) {
+      loaded.set(regimeDir, fetchRegimeData(regimeDir, types).then(data => new FactorioData(data)));
+    }
+    return loaded.get(regimeDir)!;
+  };
+}
+
 export class FactorioData {
   readonly items: Record<string, Item>;
   readonly subgroups: Record<string, Subgroup>;
   readonly groups: Record<string, Group>;
   readonly entities: Record<string, Entity>;
+  // The language to show, and the locales loaded for it: that language and English.
+  readonly language: string;
   readonly locale: Record<string, any>;
   readonly recipes: Record<string, Recipe>;
   readonly techs: Record<string, Tech>;
+  readonly graph: GraphIndex;
+  readonly atlas: IconAtlas | null;
   readonly character = new Entity(this, {
     name: 'character',
     type: 'character',
@@ -154,20 +260,27 @@ export class FactorioData {
       .toPairs()
       .map(([entityType, ClassType]) => createRecord(data['raw'][entityType] || {}, ClassType))
       .reduce((acc, record) => ({ ...acc, ...record }), {});
-    this.subgroups = createRecord(data['raw']['item-subgroup'], Subgroup);
-    this.groups = createRecord(data['raw']['item-group'], Group);
-    this.recipes = createRecord(data['raw']['recipe'], Recipe);
-    this.techs = createRecord(data['raw']['technology'], Tech);
+    this.subgroups = createRecord(data['raw']['item-subgroup'] || {}, Subgroup);
+    this.groups = createRecord(data['raw']['item-group'] || {}, Group);
+    this.recipes = createRecord(data['raw']['recipe'] || {}, Recipe);
+    this.techs = createRecord(data['raw']['technology'] || {}, Tech);
+    this.language = data['language'];
     this.locale = data['locale'];
+    this.graph = data['graph'];
+    this.atlas = data['atlas'];
   }
 
   localize(language: string, name: string): string {
     const locale = this.locale[language];
+    const match = name.match(/(.*)-(\d+)$/);
+    if (language !== 'en' && !(name in locale) && !(match && match[1] in locale)) {
+      // Shown in English where the translation has nothing.
+      return this.localize('en', name);
+    }
     let localized: string = '';
     if (name in locale) {
       localized = locale[name];
     } else {
-      const match = name.match(/(.*)-(\d+)$/);
       if (!match || !(locale && match[1] in locale)) {
         // XXX This is a horrible kludge
         return '';
@@ -99,7 +99,7 @@ export class Turret extends Entity {
     const attack_params = this.json['attack_parameters'];
     if (attack_params['type'] === 'stream') {
       const ammo = attack_params['fluids'].map((ammo: any) => this.data.items[ammo['type']]);
-      return [[this.data.localize('en', 'ammo-category-name.fluid'), ammo]];
+      return [[this.data.localize(this.data.language, 'ammo-category-name.fluid'), ammo]];
     } else {
       let categories: string[];
       if ('ammo_type' in attack_params) {
@@ -113,7 +113,7 @@ export class Turret extends Entity {
       }
 
       return categories.map(category => {
-        let category_name = this.data.localize('en', `ammo-category-name.${category}`);
+        let category_name = this.data.localize(this.data.language, `ammo-category-name.${category}`);
         if (!category_name) {
           category_name = category;
         }
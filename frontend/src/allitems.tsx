@@ -40,7 +40,7 @@ export default function AllItems() {
         <div className="group-container" key={group.name}>
           <h2 className="group" onClick={() => setSelectedGroup(group.name)}>
             <img src={`/generated/${regime}/icons/item-group/${group.name}.png`} alt={group.name} />
-            {group.localized_title('en')}
+            {group.localized_title(data.language)}
           </h2>
         </div>
       ))}
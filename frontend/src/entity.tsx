@@ -136,7 +136,7 @@ export default function Entity() {
     <DialogHeader>
       <img src={`/generated/${regime}/icons/${entity.type}/${entity.name}.png`} alt={entity.name} />
       <div className="description">
-        <BBCode code={entity.description('en')} />
+        <BBCode code={entity.description(data.language)} />
       </div>
     </DialogHeader>
     {entity instanceof RocketSiloType ? <RocketSilo entity={entity} /> :
@@ -9,7 +9,8 @@ import Recipe from './recipe';
 import './factorio.css';
 import { TechTree } from './techtree';
 import { Dialog } from './Dialog';
-import { FactorioData } from './FactorioData';
+import { loadRegimeData } from './FactorioData';
+import { all_items } from './superclass';
 
 const root = ReactDOM.createRoot(
   document.getElementById('root') as HTMLElement
@@ -26,15 +27,27 @@ function ListRegimes() {
   );
 }
 
+const loadAll = loadRegimeData();
+const loadTechTree = loadRegimeData(['technology', 'recipe', ...all_items]);
+
+function RegimeData({ load = loadAll, children }: { load?: (regimeDir: string) => Promise<any>; children: React.ReactNode }) {
+  const { regime } = useParams();
+  return (
+    <DataProvider path={`/generated/${regime}`} load={load}>
+      {children}
+    </DataProvider>
+  );
+}
+
 function RegimeHeader() {
   const { regime } = useParams();
   return (
-    <DataProvider path={`/generated/${regime}/data.json`} fn={data => new FactorioData(data)}>
+    <>
       <div className='navbar'>
         Regime: { regime } | <Link to={`/${regime}`}>All items</Link> | <Link to={`/${regime}/tech`}>Tech</Link>
       </div>
       <Outlet />
-    </DataProvider>
+    </>
   );
 }
 
@@ -44,11 +57,11 @@ root.render(
       <Routes>
         <Route path="/" element={<DataProvider path="/generated/config.json"><ListRegimes /></DataProvider>} />
         <Route path="/:regime" element={<RegimeHeader />}>
-          <Route index element={<AllItems />} />
-          <Route path="tech" element={<TechTree />} />
-          <Route path="recipe/:name" element={<Recipe />} />
-          <Route path="item/:name" element={<Item />} />
-          <Route path="entity/:name" element={<Entity />} />
+          <Route index element={<RegimeData><AllItems /></RegimeData>} />
+          <Route path="tech" element={<RegimeData key="tech" load={loadTechTree}><TechTree /></RegimeData>} />
+          <Route path="recipe/:name" element={<RegimeData><Recipe /></RegimeData>} />
+          <Route path="item/:name" element={<RegimeData><Item /></RegimeData>} />
+          <Route path="entity/:name" element={<RegimeData><Entity /></RegimeData>} />
         </Route>
       </Routes>
     </Router>
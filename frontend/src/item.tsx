@@ -20,11 +20,11 @@ export default function Item() {
   const data = useData<FactorioData>();
   const item = data.items[name!];
 
-  return <Dialog title={`Item: ${item.localized_title('en')}`}>
+  return <Dialog title={`Item: ${item.localized_title(data.language)}`}>
     <DialogHeader>
       <img src={`/generated/${regime}/icons/${item.type}/${name}.png`} alt={name} />
       <div className="description">
-        <BBCode code={item.description('en')} />
+        <BBCode code={item.description(data.language)} />
       </div>
     </DialogHeader>
 
@@ -42,7 +42,7 @@ export default function Item() {
     </div>
     {item.placement_result && (
       <>
-        <h2>Entity: {item.placement_result.localized_title('en')}</h2>
+        <h2>Entity: {item.placement_result.localized_title(data.language)}</h2>
         <Link to={`/${regime}/entity/${item.placement_result.name}`}>More info</Link>
       </>
     )}
@@ -7,11 +7,12 @@ import { ItemIcon } from "./Elements";
 import { FactorioData } from './FactorioData';
 
 function RenderItemWithCount({ itemWithCount }: { itemWithCount: ItemWithCount }) {
+  const data = useData<FactorioData>();
   return (
     <tr>
       <td style={{ textAlign: 'right' }}>{itemWithCount.quantity}</td>
       <td><ItemIcon item={itemWithCount.item} /></td>
-      <td>{itemWithCount.localized_title('en')}</td>
+      <td>{itemWithCount.localized_title(data.language)}</td>
     </tr>
   );
 }
@@ -24,7 +25,7 @@ export default function Recipe() {
     <DialogHeader>
       <img src={`/generated/${regime}/icons/${recipe.type}/${recipe.name}.png`} alt={recipe.name} />
       <div className="description">
-        <BBCode code={recipe.description('en')} />
+        <BBCode code={recipe.description(data.language)} />
       </div>
     </DialogHeader>
     <div style={{ display: "flex", justifyContent: "space-between" }}>
@@ -49,7 +50,7 @@ export default function Recipe() {
         {recipe.crafted_in.map(([entity, time]) => (
           <a key={entity.name} className="item" href={`item_${entity.name}.html`}>
             {/* TODO entity icon here! <ItemIcon entity={entity} /> */}
-            {entity.localized_title('en')} ({time.toFixed(2)}s)
+            {entity.localized_title(data.language)} ({time.toFixed(2)}s)
           </a>
         ))}
       </div>
@@ -0,0 +1,10 @@
+// Loaded by `npm start`. With RENDER_SERVER set (`python backend/cli.py serve`
+// listens on http://localhost:8000), /generated/ is answered by the render
+// server instead of public/generated.
+const { createProxyMiddleware } = require('http-proxy-middleware');
+
+module.exports = function (app) {
+  if (process.env.RENDER_SERVER) {
+    app.use(createProxyMiddleware('/generated', { target: process.env.RENDER_SERVER }));
+  }
+};
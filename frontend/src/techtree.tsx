@@ -1,6 +1,6 @@
-import { useParams } from "react-router-dom";
 import { useData } from './DataContext';
 import { Dialog, DialogHeader } from "./Dialog";
+import { Icon } from "./Elements";
 import { Tech } from './FactorioTypes';
 import { FactorioData } from './FactorioData';
 
@@ -9,28 +9,26 @@ const LAYER_WIDTH = 250;
 // NOTE: there are more hard-coded numbers later down. :(
 
 export function TechTree() {
-  const { techs } = useData<FactorioData>();
-  const { regime } = useParams();
+  const { techs, graph, language } = useData<FactorioData>();
 
   const nodes: Record<string, {tech: Tech, x: number, y: number}> = {};
   const edges: Array<[string, string]> = [];
 
-  let techsRemaining = new Set(Object.keys(techs));
-  let techsDone = new Set<string>();
-
-  let y = 0;
-  while (true) {
-    // eslint-disable-next-line no-loop-func -- (Known false positives with array functions)
-    const nextLayer = Array.from(techsRemaining).filter(tech =>
-      // @ts-ignore  (isSubsetOf is new enough that TS has problems with it)
-      techs[tech].prerequisites.isSubsetOf(techsDone)
-    )
-    if (nextLayer.length === 0) {
-      break;
+  // A technology's layer is its depth in the graph index: the length of the
+  // longest chain of prerequisites leading to it. Technologies that can never
+  // be researched have no depth and are left out.
+  const layers: string[][] = [];
+  graph.technologies.forEach((tech, i) => {
+    const depth = graph.depth[i];
+    if (depth !== null && tech in techs) {
+      (layers[depth] = layers[depth] || []).push(tech);
     }
+  });
 
+  let y = 0;
+  for (const layer of layers) {
     let x = 0;
-    for (const tech of Array.from(nextLayer)) {
+    for (const tech of layer) {
       nodes[tech] = {
         x: (x + y % 2 / 2) * LAYER_WIDTH,
         y: y * LAYER_HEIGHT,
@@ -45,23 +43,22 @@ export function TechTree() {
     if (x !== 0) {
       y++;
     }
-    // @ts-ignore
-    techsDone = techsDone.union(new Set(nextLayer));
-    // @ts-ignore
-    techsRemaining = techsRemaining.difference(new Set(nextLayer));
   }
 
-  Object.values(techs).forEach((tech) => {
-    tech.prerequisites.forEach((prereq) => {
-      edges.push([ prereq, tech.name ]);
-    });
+  graph.prerequisites.forEach((prerequisites, i) => {
+    const tech = graph.technologies[i];
+    if (tech in nodes) {
+      prerequisites.forEach((prereq) => {
+        edges.push([ graph.technologies[prereq], tech ]);
+      });
+    }
   });
 
   const TechNode = ({ tech, x, y }: { tech: Tech; x: number; y: number }) => {
     return (
       <div className="tech" style={{top: y, left: x}}>
-        <img width={128} height={128} src={`/generated/${regime}/icons/technology/${tech.name}.png`} alt={tech.name} />
-        {tech.localized_title('en')}
+        <Icon type='technology' name={tech.name} size={128} />
+        {tech.localized_title(language)}
       </div>
     );
   };